@@ -2,6 +2,7 @@ import wx
 from frames.view import ViewFrame
 from frames.crawl import CrawlFrame
 from frames.rating import RatingFrame
+from frames.db import ensure_indexes_on_startup
 
 
 class MyFrame(wx.Frame):
@@ -37,6 +38,8 @@ class MyFrame(wx.Frame):
 
 
 if __name__ == "__main__":
+    # 検索・登録で使用するインデックスを作成
+    ensure_indexes_on_startup()
     app = wx.App()
     MyFrame(None, -1, 'comist')
     app.MainLoop()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+import os.path as osp
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def replacing(path):
+    """
+    一時ファイルに書き込み、withブロックを抜けた時に目的のパスへ置換する
+    書き込み途中のファイルを他のスレッド・プロセスが読むことはなく、
+    中断された場合も既存のファイルは壊れない
+        with replacing(path) as tmp_path:
+            tmp_pathに書き込む
+    input
+      path: str or Path, 書き込み先のパス(親ディレクトリは作成する)
+    output: str, 一時ファイルのパス
+    """
+    path = str(path)
+    dir_name = osp.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    # 同じパスへ複数のスレッドから書き込む場合があるため、スレッドごとに分ける
+    tmp_path = '{0}.{1}.{2}.tmp'.format(
+        path, os.getpid(), threading.get_ident())
+    try:
+        yield tmp_path
+    except BaseException:
+        if osp.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+保存済みの漫画の表紙サムネイルと表示サイズの縮小画像を作成する
+
+IMAGES_STORE以下の漫画ごとのディレクトリについて、
+RENDITIONS_STOREに表紙サムネイル(cover.jpg)と縮小したページ(pages/)を作成する。
+表紙サムネイルが作成済みの漫画はスキップする(--forceで再作成)。
+
+cc_scrapyディレクトリで実行する
+    python -m ComicScrapy.backfill_renditions [--force]
+"""
+import argparse
+from pathlib import Path
+
+from scrapy.utils.project import get_project_settings
+
+from ComicScrapy.pipelines import (
+    cover_rendition_path, natural_key, render_comic)
+
+
+def iter_comic_dirs(images_store):
+    """
+    漫画ごとのディレクトリを列挙する
+    (IMAGES_STORE/サイト名/カテゴリ/エントリ番号)
+    """
+    for path in sorted(images_store.glob("*/*/*")):
+        if path.is_dir():
+            yield path
+
+
+def backfill(images_store, renditions_store, settings, force=False):
+    """
+    縮小画像を作成する
+    output: tuple, (処理した漫画数, 作成した画像数)
+    """
+    num_comics = 0
+    num_rendered = 0
+    for comic_dir in iter_comic_dirs(images_store):
+        rel_dir = comic_dir.relative_to(images_store)
+        if not force and cover_rendition_path(
+                renditions_store, rel_dir).exists():
+            continue
+        # 一覧表示と同様に、自然順でソートした先頭のページを表紙とする
+        image_paths = sorted(
+            (rel_dir / path.name for path in comic_dir.iterdir()
+             if path.is_file()),
+            key=lambda path: natural_key(path.name))
+        if not image_paths:
+            continue
+        try:
+            num_rendered += render_comic(
+                images_store, renditions_store, image_paths, settings)
+        except OSError as e:
+            print("failed to render {0}: {1}".format(rel_dir, e))
+            continue
+        num_comics += 1
+    return num_comics, num_rendered
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument('--force', action='store_true',
+                        help='re-render comics that already have a cover')
+    args = parser.parse_args()
+    settings = get_project_settings()
+    renditions_store = settings.get('RENDITIONS_STORE')
+    if not renditions_store:
+        raise ValueError("RENDITIONS_STORE is not set.")
+    num_comics, num_rendered = backfill(
+        Path(settings.get('IMAGES_STORE')), Path(renditions_store),
+        settings, args.force)
+    print("comics: {0}, rendered images: {1}".format(
+        num_comics, num_rendered))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+"""
+オフラインのクロールベンチマーク
+
+eromanga-yoru.com の代わりにローカルのHTTPサーバーで合成した
+一覧・詳細・連作リダイレクト・画像を返し、GetComicsSpider を
+MongoPipeline, SaveComicPipeline 込みで実行してスループットを計測する。
+
+cc_scrapyディレクトリで実行する(ローカルのmongodが必要)
+    python -m ComicScrapy.benchmark --categories gyaru,rape --entries 40
+
+登録先DB(MONGO_DATABASE)と画像・キャッシュの保存先は一時的なものを使用し、
+通常のクロール結果には影響しない。
+"""
+import argparse
+import inspect
+import io
+import json
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.parse
+
+from PIL import Image
+from pymongo import MongoClient
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from ComicScrapy.spiders.GetComics import GetComicsSpider
+
+
+# ベンチマーク用の登録先DB
+BENCH_DATABASE = 'ComistBenchmark'
+# 合成サイトのエントリ番号の開始値
+BASE_ENTRY_ID = 100000
+
+
+class StandInSite(object):
+    """
+    クロール対象サイトの代わりに一覧・詳細・画像を合成する
+    URLは本番と同じ形式(https://eromanga-yoru.com/...)で生成する
+    """
+    host = "https://eromanga-yoru.com"
+
+    def __init__(self, categories, entries, per_page, images,
+                 series_length, image_size):
+        """
+        categories: list, 合成するカテゴリ
+        entries: int, カテゴリごとのエントリ数
+        per_page: int, 一覧ページあたりのエントリ数
+        images: int, エントリあたりの画像数
+        series_length: int, 連作のエントリ数(0の場合は連作なし)
+        image_size: tuple, 画像サイズ (width, height)
+        """
+        self.categories = categories
+        self.entries = entries
+        self.per_page = per_page
+        self.images = images
+        self.series_length = series_length
+        self.image = self._make_image(image_size)
+
+    @staticmethod
+    def _make_image(image_size):
+        """
+        漫画画像の代わりにノイズ画像(jpeg)を作成する
+        """
+        buf = io.BytesIO()
+        image = Image.effect_noise(image_size, 64).convert('RGB')
+        image.save(buf, 'JPEG', quality=85)
+        return buf.getvalue()
+
+    def page_image(self, entry_id, page):
+        """
+        画像ページ
+        全ページが同一内容だとチェックサムが一致してハードリンクになり、
+        本番と異なる書き込み量になるため、エントリ・ページ番号を
+        コメントセグメント(COM)としてSOIの直後に埋め込む
+        """
+        comment = "{0}/{1}".format(entry_id, page).encode('ascii')
+        segment = b'\xff\xfe' + struct.pack('>H', len(comment) + 2) + comment
+        return self.image[:2] + segment + self.image[2:]
+
+    def _entry_ids(self, category):
+        """
+        カテゴリのエントリ番号を新しい順に返す
+        """
+        offset = self.categories.index(category) * self.entries
+        first = BASE_ENTRY_ID + offset
+        return list(range(first + self.entries - 1, first - 1, -1))
+
+    def _entry_url(self, category, entry_id):
+        return "{0}/{1}-a/{2}".format(self.host, category, entry_id)
+
+    def listing(self, category, page):
+        """
+        一覧ページ
+        """
+        entry_ids = self._entry_ids(category)
+        start = (page - 1) * self.per_page
+        page_ids = entry_ids[start:start + self.per_page]
+        if not page_ids:
+            return None
+        links = "".join(
+            '<a href="{0}">{1}</a>'.format(self._entry_url(category, i), i)
+            for i in page_ids
+        )
+        next_link = ""
+        if start + self.per_page < len(entry_ids):
+            next_link = (
+                '<div class="wp-pagenavi"><a class="nextpostslink" '
+                'href="{0}/category/{1}/page/{2}">next</a></div>'
+            ).format(self.host, category, page + 1)
+        return ('<html><body><div class="article-body-inner">{0}</div>'
+                '{1}</body></html>').format(links, next_link)
+
+    def detail(self, category, entry_id):
+        """
+        詳細ページ
+        """
+        if entry_id not in self._entry_ids(category):
+            return None
+        images = "".join(
+            '<img src="{0}/wp-content/uploads/{1}/{2:03d}.jpg">'.format(
+                self.host, entry_id, n)
+            for n in range(self.images)
+        )
+        tags = "".join(
+            '<li><a>tag{0}</a></li>'.format(n) for n in range(5)
+        )
+        series = ""
+        if self.series_length > 0:
+            first = min(self._entry_ids(category))
+            group = (entry_id - first) // self.series_length
+            # カテゴリ末尾の連作は存在するエントリまでとする
+            length = min(self.series_length,
+                         self.entries - group * self.series_length)
+            series = "".join(
+                '<li><a href="{0}/series/{1}/{2}/{3}">{3}</a></li>'.format(
+                    self.host, category, group, n)
+                for n in range(length)
+            )
+            series = '<div class="box_rensaku"><ul>{0}</ul></div>'.format(
+                series)
+        return (
+            '<html><body>'
+            '<h1 class="entry-title"><a>【author{0}:title{0}】</a></h1>'
+            '<ul class="post-categories"><li><a>{1}</a></li></ul>'
+            '<section class="entry-content">{2}</section>'
+            '{3}'
+            '<div class="article-tags"><ul>{4}</ul></div>'
+            '<div class="article-tags"><ul>{4}</ul></div>'
+            '</body></html>'
+        ).format(entry_id, category, images, series, tags)
+
+    def series_target(self, category, group, n):
+        """
+        連作リンクのリダイレクト先
+        """
+        first = min(self._entry_ids(category))
+        entry_id = first + group * self.series_length + n
+        return self._entry_url(category, entry_id)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    StandInSiteの内容を返すHTTPハンドラ
+    """
+    site = None
+    # レスポンスごとに追加する待ち時間[sec]
+    latency = 0.0
+
+    routes = [
+        (re.compile(r'^/category/([^/]+)(?:/page/([0-9]+))?/?$'), 'listing'),
+        (re.compile(r'^/([^/]+)-a/([0-9]+)/?$'), 'detail'),
+        (re.compile(r'^/series/([^/]+)/([0-9]+)/([0-9]+)$'), 'series'),
+        (re.compile(r'^/wp-content/uploads/([0-9]+)/([0-9]+)\.jpg$'),
+         'image'),
+    ]
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = urllib.parse.urlparse(self.path).path
+        for pattern, kind in self.routes:
+            match = pattern.match(path)
+            if match:
+                return getattr(self, '_' + kind)(*match.groups())
+        self.send_error(404)
+
+    def _listing(self, category, page):
+        body = self.site.listing(category, int(page or 1))
+        self._send(body, 'text/html; charset=utf-8')
+
+    def _detail(self, category, entry_id):
+        body = self.site.detail(category, int(entry_id))
+        self._send(body, 'text/html; charset=utf-8')
+
+    def _series(self, category, group, n):
+        self.send_response(302)
+        self.send_header(
+            'Location', self.site.series_target(category, int(group), int(n)))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _image(self, entry_id, page):
+        body = self.site.page_image(int(entry_id), int(page))
+        self._send(body, 'image/jpeg')
+
+    def _send(self, body, content_type):
+        if body is None:
+            return self.send_error(404)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # アクセスログは出力しない
+        pass
+
+
+class LocalSiteDownloadHandler(HTTP11DownloadHandler):
+    """
+    クロール対象サイトへのリクエストをローカルのStandInSiteに送る
+    レスポンスのURLは元のURLに戻すため、spider・pipelineからは
+    本番サイトをクロールしている場合と区別できない
+    """
+
+    def __init__(self, settings, crawler=None):
+        super(LocalSiteDownloadHandler, self).__init__(settings, crawler)
+        self.local_base = "http://127.0.0.1:{0}".format(
+            settings.getint('BENCHMARK_SITE_PORT'))
+
+    def download_request(self, request, spider):
+        parsed = urllib.parse.urlparse(request.url)
+        local_url = self.local_base + parsed.path
+        if parsed.query:
+            local_url += "?" + parsed.query
+        dfd = super(LocalSiteDownloadHandler, self).download_request(
+            request.replace(url=local_url), spider)
+        dfd.addCallback(lambda response: response.replace(url=request.url))
+        return dfd
+
+
+class BenchGetComicsSpider(GetComicsSpider):
+    """
+    callbackごとのCPU時間を計測するGetComicsSpider
+    """
+    name = 'GetComicsBench'
+
+    def __init__(self, *args, **kwargs):
+        # start_urlsはクラス変数のため、GetComicsSpiderと共有しない
+        self.start_urls = []
+        super(BenchGetComicsSpider, self).__init__(*args, **kwargs)
+        # callback名 -> CPU時間[sec]
+        self.cpu_time = defaultdict(float)
+        # callback名 -> 呼び出し回数
+        self.calls = defaultdict(int)
+
+    def parse(self, response):
+        return self._timed('parse', super().parse, response)
+
+    def entry_parse(self, response):
+        return self._timed('entry_parse', super().entry_parse, response)
+
+    def continuous_parse(self, response):
+        return self._timed(
+            'continuous_parse', super().continuous_parse, response)
+
+    def _timed(self, name, callback, response):
+        """
+        callbackを実行し、CPU時間を計測する
+        generatorを返すcallbackは要素を取り出すたびに計測する
+        """
+        self.calls[name] += 1
+        start = time.thread_time()
+        result = callback(response)
+        self.cpu_time[name] += time.thread_time() - start
+        if inspect.isgenerator(result):
+            return self._timed_iter(name, result)
+        return result
+
+    def _timed_iter(self, name, gen):
+        while True:
+            start = time.thread_time()
+            try:
+                value = next(gen)
+            except StopIteration:
+                self.cpu_time[name] += time.thread_time() - start
+                return
+            self.cpu_time[name] += time.thread_time() - start
+            yield value
+
+
+def start_site(site, latency):
+    """
+    StandInSiteをローカルのHTTPサーバーで公開する
+    output: ThreadingHTTPServer (ポートは自動で割り当て)
+    """
+    handler = type('Handler', (StandInHandler,),
+                   {'site': site, 'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def make_settings(port, work_dir, overrides):
+    """
+    ベンチマーク用のscrapy設定を作成する
+    """
+    settings = get_project_settings()
+    settings.setdict({
+        'BENCHMARK_SITE_PORT': port,
+        'DOWNLOAD_HANDLERS': {
+            'https': 'ComicScrapy.benchmark.LocalSiteDownloadHandler',
+        },
+        'MONGO_DATABASE': BENCH_DATABASE,
+        'IMAGES_STORE': work_dir + '/Comics',
+        'IMAGES_OBJECT_STORE': work_dir + '/ImageObjects',
+        'RENDITIONS_STORE': work_dir + '/Renditions',
+        'CONTINUOUS_CACHE_PATH': work_dir + '/continuous_cache.json',
+        'CRAWL_WATERMARK_PATH': work_dir + '/crawl_watermark.json',
+        'METRICS_PATH': work_dir + '/crawl_metrics.json',
+        'HTTPCACHE_ENABLED': False,
+        # 計測対象はクローラ自体のため、待ち時間は既定で無効にする
+        'DOWNLOAD_DELAY': 0,
+        'IMAGE_SLOT_DELAY': 0,
+        'ROBOTSTXT_OBEY': False,
+        'LOG_LEVEL': 'WARNING',
+    }, priority='cmdline')
+    for override in overrides:
+        key, value = override.split("=", 1)
+        settings.set(key, value, priority='cmdline')
+    return settings
+
+
+def collect_report(crawler, elapsed):
+    """
+    crawlerの統計情報から計測結果を作成する
+    """
+    stats = crawler.stats.get_stats()
+    spider = crawler.spider
+    pages = sum(spider.calls.values())
+    items = stats.get('item_scraped_count', 0)
+    response_bytes = stats.get('downloader/response_bytes', 0)
+    return {
+        'elapsed_sec': elapsed,
+        'items': items,
+        'items_dropped': stats.get('item_dropped_count', 0),
+        'pages': pages,
+        'responses': stats.get('response_received_count', 0),
+        'response_bytes': response_bytes,
+        'items_per_sec': items / elapsed,
+        'pages_per_sec': pages / elapsed,
+        'bytes_per_sec': response_bytes / elapsed,
+        'callback_calls': dict(spider.calls),
+        'callback_cpu_sec': dict(spider.cpu_time),
+    }
+
+
+def print_report(report):
+    print("elapsed      : {0:.2f} s".format(report['elapsed_sec']))
+    print("items        : {0} ({1:.2f} items/s, {2} dropped)".format(
+        report['items'], report['items_per_sec'], report['items_dropped']))
+    print("html pages   : {0} ({1:.2f} pages/s)".format(
+        report['pages'], report['pages_per_sec']))
+    print("bytes        : {0} ({1:.0f} bytes/s)".format(
+        report['response_bytes'], report['bytes_per_sec']))
+    print("callback CPU time:")
+    for name, cpu in sorted(report['callback_cpu_sec'].items()):
+        calls = report['callback_calls'][name]
+        print("  {0:<18}{1:>6} calls {2:>9.3f} s ({3:.2f} ms/call)".format(
+            name, calls, cpu, cpu * 1000 / calls))
+
+
+def run_benchmark(args):
+    categories = [c.strip() for c in args.categories.split(",")]
+    for c in categories:
+        if c not in GetComicsSpider.category_list or c == "front":
+            raise ValueError(c + " is not in category list.")
+    site = StandInSite(
+        categories, args.entries, args.per_page, args.images,
+        args.series_length, tuple(map(int, args.image_size.split("x"))),
+    )
+    server = start_site(site, args.latency)
+    work_dir = tempfile.mkdtemp(prefix='comist_bench_')
+    settings = make_settings(server.server_address[1], work_dir, args.set)
+    client = MongoClient(settings.get('MONGO_HOST'),
+                         settings.getint('MONGO_PORT'))
+    client.drop_database(BENCH_DATABASE)
+    try:
+        process = CrawlerProcess(settings)
+        crawler = process.create_crawler(BenchGetComicsSpider)
+        process.crawl(crawler, category=",".join(categories))
+        start = time.perf_counter()
+        process.start()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        client.drop_database(BENCH_DATABASE)
+        client.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report = collect_report(crawler, elapsed)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument('--categories', default='gyaru',
+                        help='comma separated categories to crawl')
+    parser.add_argument('--entries', type=int, default=40,
+                        help='entries per category')
+    parser.add_argument('--per-page', type=int, default=20,
+                        help='entries per listing page')
+    parser.add_argument('--images', type=int, default=20,
+                        help='images per entry')
+    parser.add_argument('--series-length', type=int, default=5,
+                        help='entries per series (0: no series links)')
+    parser.add_argument('--image-size', default='712x1024',
+                        help='image size, WIDTHxHEIGHT')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every response')
+    parser.add_argument('--output', help='write the report as json')
+    parser.add_argument('-s', '--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='override a scrapy setting')
+    run_benchmark(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
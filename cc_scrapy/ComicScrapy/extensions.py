@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+# Define here your custom extensions
+#
+# See documentation in:
+# https://doc.scrapy.org/en/latest/topics/extensions.html
+
+import json
+import socket
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+from ComicScrapy.atomic_file import replacing
+
+
+class LatencyHistogram(object):
+    """
+    リクエストのレイテンシ[sec]のヒストグラム
+    """
+    # 各binの上限[sec] (最後のbinは上限なし)
+    BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, latency):
+        idx = len(self.BUCKETS)
+        for i, upper in enumerate(self.BUCKETS):
+            if latency <= upper:
+                idx = i
+                break
+        self.counts[idx] += 1
+        self.count += 1
+        self.sum += latency
+
+    def to_dict(self):
+        return {
+            'buckets': self.BUCKETS,
+            'counts': self.counts,
+            'count': self.count,
+            'sum': self.sum,
+        }
+
+
+class CrawlMetrics(object):
+    """
+    クロールのメトリクスを定期的にjsonファイルへ書き出す拡張
+    CrawlFrameはこのファイルを読み込んで表示する
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.path = settings.get('METRICS_PATH')
+        self.interval = settings.getfloat('METRICS_INTERVAL')
+        # リクエスト種別(html, image)ごとのレイテンシ
+        self.latency = {
+            'html': LatencyHistogram(),
+            'image': LatencyHistogram(),
+        }
+        self.started_at = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed,
+                                signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received,
+                                signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        self.started_at = time.time()
+        self.task = task.LoopingCall(self.dump, spider, 'running')
+        self.task.start(self.interval, now=True)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.dump(spider, reason)
+
+    def response_received(self, response, request, spider):
+        latency = request.meta.get('download_latency')
+        kind = 'image' if request.meta.get('image_request') else 'html'
+        self.stats.inc_value('comist/{0}/responses'.format(kind))
+        self.stats.inc_value('comist/{0}/bytes'.format(kind),
+                             len(response.body))
+        if latency is not None:
+            self.latency[kind].add(latency)
+
+    def _queue_depth(self):
+        """
+        スケジューラに溜まっているリクエスト数と処理中のリクエスト数
+        """
+        engine = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return 0, 0
+        return len(engine.slot.scheduler), len(engine.slot.inprogress)
+
+    def _pipeline_timings(self):
+        """
+        pipelineの処理ごとの合計時間[sec]と処理回数
+        """
+        timings = {}
+        for name in ('mongo', 'image', 'rendition'):
+            timings[name] = {
+                'count': self.stats.get_value(
+                    'comist/pipeline/{0}/count'.format(name), 0),
+                'sum': self.stats.get_value(
+                    'comist/pipeline/{0}/sec'.format(name), 0.0),
+            }
+        return timings
+
+    def collect(self, spider, state):
+        """
+        メトリクスを集計する
+        """
+        queued, inprogress = self._queue_depth()
+        return {
+            'spider': spider.name,
+            'state': state,
+            'updated_at': time.time(),
+            'elapsed_sec': time.time() - self.started_at,
+            'items_scraped': self.stats.get_value('item_scraped_count', 0),
+            'items_dropped': self.stats.get_value('item_dropped_count', 0),
+            'listing_pages': self.stats.get_value('comist/listing_pages', 0),
+            'html_responses': self.stats.get_value('comist/html/responses', 0),
+            'html_bytes': self.stats.get_value('comist/html/bytes', 0),
+            'image_responses': self.stats.get_value(
+                'comist/image/responses', 0),
+            'image_bytes': self.stats.get_value('comist/image/bytes', 0),
+            'queue_depth': queued,
+            'image_queue': self.stats.get_value(
+                'comist/pipeline/image/queue', 0),
+            'in_progress': inprogress,
+            'latency': {k: v.to_dict() for k, v in self.latency.items()},
+            'pipeline': self._pipeline_timings(),
+        }
+
+    def dump(self, spider, state):
+        """
+        メトリクスをjsonファイルに書き出す
+        """
+        metrics = self.collect(spider, state)
+        with replacing(self.path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(metrics, f)
+
+
+class ProgressEvents(object):
+    """
+    クロールの進捗をJSON-lines形式のイベントとしてGUIに送る拡張
+    PROGRESS_ADDRESS(host:port)でGUIが待ち受けるソケットに接続する
+    (未指定の場合は無効)
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        address = settings.get('PROGRESS_ADDRESS')
+        if not address:
+            raise NotConfigured
+        host, port = address.rsplit(':', 1)
+        self.address = (host, int(port))
+        self.name = settings.get('PROGRESS_NAME')
+        self.interval = settings.getfloat('PROGRESS_INTERVAL')
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.sock = None
+        self.task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened,
+                                signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed,
+                                signal=signals.spider_closed)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(ext.response_received,
+                                signal=signals.response_received)
+        return ext
+
+    def spider_opened(self, spider):
+        try:
+            self.sock = socket.create_connection(self.address, timeout=5)
+        except OSError as e:
+            spider.logger.warning('failed to connect progress channel: %s', e)
+            return
+        self.send({'event': 'opened', 'job': self.name})
+        self.task = task.LoopingCall(self.send_progress, 'running')
+        self.task.start(self.interval, now=True)
+
+    def spider_closed(self, spider, reason):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        self.send_progress(reason)
+        self.send({'event': 'closed', 'reason': reason})
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def item_scraped(self, item, response, spider):
+        self.send({'event': 'item_stored', 'comic_key': item['comic_key'],
+                   'num_images': item['num_images']})
+
+    def item_dropped(self, item, response, exception, spider):
+        self.send({'event': 'item_dropped',
+                   'comic_key': item.get('comic_key'),
+                   'reason': str(exception)})
+
+    def response_received(self, response, request, spider):
+        # 画像は件数が多いため、定期的な進捗の件数・バイト数にのみ含める
+        if request.meta.get('image_request'):
+            return
+        self.send({'event': 'page_fetched', 'url': response.url,
+                   'status': response.status, 'bytes': len(response.body)})
+
+    def send_progress(self, state):
+        """
+        キューの状態と累計の件数・バイト数を送る
+        """
+        engine = self.crawler.engine
+        queued, inprogress = 0, 0
+        if engine is not None and engine.slot is not None:
+            queued = len(engine.slot.scheduler)
+            inprogress = len(engine.slot.inprogress)
+        get = self.stats.get_value
+        self.send({
+            'event': 'progress',
+            'state': state,
+            # 取得対象のエントリ数(一覧ページのクロールに伴い増加する)
+            'entries': get('comist/entry_requests', 0) +
+            get('comist/repair_items', 0),
+            'items_stored': get('item_scraped_count', 0),
+            'items_dropped': get('item_dropped_count', 0),
+            'queue_depth': queued,
+            'in_progress': inprogress,
+            'image_queue': get('comist/pipeline/image/queue', 0),
+            'html_bytes': get('comist/html/bytes', 0),
+            'image_bytes': get('comist/image/bytes', 0),
+        })
+
+    def send(self, event):
+        """
+        イベントを1行のjsonとして送る
+        GUIが終了している場合は以降のイベントを送らない
+        """
+        if self.sock is None:
+            return
+        event['time'] = time.time()
+        try:
+            self.sock.sendall((json.dumps(event) + '\n').encode('utf-8'))
+        except OSError:
+            self.sock.close()
+            self.sock = None
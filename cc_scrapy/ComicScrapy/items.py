@@ -19,3 +19,5 @@ class ComicImageItem(scrapy.Item):
     tags = scrapy.Field()               # 漫画が持つtag情報
     category = scrapy.Field()           # カテゴリ(日本語)
     rate = scrapy.Field()               # レート
+    images = scrapy.Field()             # 保存した画像の情報(path, checksum)
+    repair = scrapy.Field()             # 保存しきれなかった画像の修復対象か
@@ -6,6 +6,8 @@
 # https://doc.scrapy.org/en/latest/topics/spider-middleware.html
 
 from scrapy import signals
+from scrapy.core.downloader import Slot
+from scrapy.exceptions import NotConfigured
 
 
 class ComicScrapySpiderMiddleware(object):
@@ -101,3 +103,69 @@ class ComicScrapyDownloaderMiddleware(object):
 
     def spider_opened(self, spider):
         spider.logger.info('Spider opened: %s' % spider.name)
+
+
+class SplitThrottleMiddleware(object):
+    """
+    画像リクエストをHTMLページとは別のダウンロードスロットに振り分ける
+    画像スロットは独自の並列数・ディレイを持ち、
+    ディレイはAutoThrottleと同様にレイテンシから調整する
+    """
+    # 画像リクエスト用のスロット名
+    IMAGE_SLOT = 'images'
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('SPLIT_THROTTLE_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.concurrency = settings.getint('IMAGE_SLOT_CONCURRENCY')
+        self.min_delay = settings.getfloat('IMAGE_SLOT_DELAY')
+        self.max_delay = settings.getfloat('IMAGE_SLOT_MAX_DELAY')
+        self.target_concurrency = settings.getfloat(
+            'IMAGE_SLOT_TARGET_CONCURRENCY')
+        self.randomize_delay = settings.getbool('RANDOMIZE_DOWNLOAD_DELAY')
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _get_image_slot(self):
+        """
+        画像スロットを取得する
+        未作成、またはアイドル状態で破棄された場合は画像用の設定で作成する
+        """
+        slots = self.crawler.engine.downloader.slots
+        if self.IMAGE_SLOT not in slots:
+            slots[self.IMAGE_SLOT] = Slot(
+                self.concurrency, self.min_delay, self.randomize_delay)
+        return slots[self.IMAGE_SLOT]
+
+    def process_request(self, request, spider):
+        # SaveComicPipelineが生成した画像リクエストのみ振り分ける
+        if request.meta.get('image_request'):
+            request.meta['download_slot'] = self.IMAGE_SLOT
+            self._get_image_slot()
+        return None
+
+    def process_response(self, request, response, spider):
+        if request.meta.get('image_request'):
+            self._adjust_delay(request, response)
+        return response
+
+    def _adjust_delay(self, request, response):
+        """
+        レイテンシから画像スロットのディレイを調整する
+        (AutoThrottleと同じ計算方法)
+        """
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return
+        slot = self._get_image_slot()
+        target_delay = latency / self.target_concurrency
+        new_delay = max(target_delay, (slot.delay + target_delay) / 2.0)
+        new_delay = max(self.min_delay, min(self.max_delay, new_delay))
+        # エラーレスポンスのレイテンシは当てにならないため、ディレイを短くしない
+        if response.status != 200 and new_delay <= slot.delay:
+            return
+        slot.delay = new_delay
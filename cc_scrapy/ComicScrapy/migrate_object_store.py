@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+保存済みの漫画画像をobject storeに移行する
+
+IMAGES_STORE以下の画像をchecksum(md5)をキーにIMAGES_OBJECT_STOREへ集約し、
+漫画ごとのディレクトリの画像をハードリンクに置き換える。
+同じ画像が複数の漫画に含まれる場合、実体は1つだけ残る。
+
+cc_scrapyディレクトリで実行する
+    python -m ComicScrapy.migrate_object_store [--dry-run]
+"""
+import argparse
+import os
+from pathlib import Path
+
+from scrapy.utils.misc import md5sum
+from scrapy.utils.project import get_project_settings
+
+from ComicScrapy.pipelines import object_path_of, link_object
+
+
+def iter_images(images_store):
+    """
+    漫画ごとのディレクトリに保存された画像を列挙する
+    (IMAGES_STORE/サイト名/カテゴリ/エントリ番号/ファイル名)
+    """
+    for path in sorted(images_store.glob("*/*/*/*")):
+        if path.is_file():
+            yield path
+
+
+def migrate(images_store, object_store, dry_run=False):
+    """
+    画像をobject storeに移行する
+    output: tuple, (処理した画像数, 重複として削減したバイト数)
+    """
+    num_images = 0
+    saved_bytes = 0
+    # dry run時にobject storeへ移したものとして扱う画像のchecksum
+    seen = set()
+    for path in iter_images(images_store):
+        num_images += 1
+        with path.open('rb') as f:
+            checksum = md5sum(f)
+        object_path = object_path_of(object_store, checksum)
+        if object_path.exists():
+            if os.path.samefile(str(object_path), str(path)):
+                # 移行済み
+                continue
+            saved_bytes += path.stat().st_size
+            if not dry_run:
+                link_object(object_path, path)
+            continue
+        if dry_run:
+            # 実際には移さないため、2回目以降の出現を重複として数える
+            if checksum in seen:
+                saved_bytes += path.stat().st_size
+            else:
+                seen.add(checksum)
+            continue
+        # 初出の画像は実体をobject storeに移し、元の場所にはハードリンクを作成
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(str(path), str(object_path))
+        except OSError:
+            os.replace(str(path), str(object_path))
+            link_object(object_path, path)
+    return num_images, saved_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report how many bytes would be saved')
+    args = parser.parse_args()
+    settings = get_project_settings()
+    object_store = settings.get('IMAGES_OBJECT_STORE')
+    if not object_store:
+        raise ValueError("IMAGES_OBJECT_STORE is not set.")
+    num_images, saved_bytes = migrate(
+        Path(settings.get('IMAGES_STORE')), Path(object_store), args.dry_run)
+    print("images: {0}, saved: {1:.1f} MB".format(
+        num_images, saved_bytes / 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+保存済みの漫画を1つのアーカイブ(無圧縮zip)にまとめる
+
+IMAGES_STORE以下の漫画ごとのディレクトリを、エントリ番号.cbz に置き換える。
+ダウンロードが完了していない漫画(DBでcomplete: false、または画像が
+num_imagesより少ない漫画)は、修復できるようディレクトリのまま残す。
+縮小画像はディレクトリから作成するため、backfill_renditionsを先に実行する。
+
+cc_scrapyディレクトリで実行する
+    python -m ComicScrapy.pack_archives [--dry-run]
+"""
+import argparse
+from pathlib import Path
+
+from pymongo import MongoClient
+from scrapy.utils.project import get_project_settings
+
+from ComicScrapy.backfill_renditions import iter_comic_dirs
+from ComicScrapy.pipelines import pack_comic
+
+
+def is_complete(doc, names):
+    """
+    漫画の全ページが保存済みかどうか
+    input
+      doc: MongoDB Document (未登録の場合はNone)
+      names: list, 保存済みの画像のファイル名
+    """
+    if doc is None or doc.get('complete') is False:
+        return False
+    return len(names) >= doc['num_images']
+
+
+def pack(images_store, db, dry_run=False):
+    """
+    漫画ごとのディレクトリをアーカイブにまとめる
+    input: db, 漫画の登録先のMongoDB (コレクション名はサイト名)
+    output: tuple, (アーカイブにした漫画数, 削減したファイル数)
+    """
+    num_comics = 0
+    num_files = 0
+    for comic_dir in iter_comic_dirs(images_store):
+        names = sorted(path.name for path in comic_dir.iterdir()
+                       if path.is_file())
+        if not names:
+            continue
+        site, category, entry = comic_dir.relative_to(images_store).parts
+        doc = db[site].find_one(
+            {'comic_key': '{0}/{1}'.format(category, entry)},
+            {'complete': 1, 'num_images': 1})
+        if not is_complete(doc, names):
+            continue
+        num_comics += 1
+        num_files += len(names) - 1
+        if not dry_run:
+            pack_comic(comic_dir, names)
+    return num_comics, num_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report how many files would be reduced')
+    args = parser.parse_args()
+    settings = get_project_settings()
+    client = MongoClient(settings.get('MONGO_HOST'),
+                         settings.getint('MONGO_PORT'))
+    try:
+        num_comics, num_files = pack(
+            Path(settings.get('IMAGES_STORE')),
+            client[settings.get('MONGO_DATABASE')], args.dry_run)
+    finally:
+        client.close()
+    print("comics: {0}, reduced files: {1}".format(num_comics, num_files))
+
+
+if __name__ == "__main__":
+    main()
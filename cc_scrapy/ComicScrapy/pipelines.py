@@ -6,38 +6,235 @@
 # See: https://doc.scrapy.org/en/latest/topics/item-pipeline.html
 
 import scrapy
-from scrapy.pipelines.images import ImagesPipeline
+from scrapy.pipelines.images import ImagesPipeline, ImageException
+from scrapy.pipelines.files import FSFilesStore
 from scrapy.utils.misc import md5sum
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from scrapy.exceptions import DropItem, CloseSpider
+from twisted.internet import defer, task, threads
+from twisted.python import threadable
+from twisted.python.threadpool import ThreadPool
 import os
 import os.path as osp
 import platform
+import re
+import shutil
+import time
+import zipfile
+from io import BytesIO
 from pathlib import Path
+from PIL import Image
 import ComicScrapy.settings as myCfg
+from ComicScrapy.atomic_file import replacing
+
+
+def object_path_of(object_store, checksum):
+    """
+    object storeにおける画像の実体のパス
+    1ディレクトリのファイル数を抑えるため、checksumの先頭2文字で分ける
+    """
+    return object_store / checksum[:2] / checksum
+
+
+def link_object(object_path, link_path):
+    """
+    画像の実体へのハードリンクを作成する
+    ハードリンクを作成できないファイルシステムではコピーする
+    """
+    link_path.parent.mkdir(parents=True, exist_ok=True)
+    if link_path.exists():
+        link_path.unlink()
+    try:
+        os.link(str(object_path), str(link_path))
+    except OSError:
+        shutil.copyfile(str(object_path), str(link_path))
+
+
+def image_path_of(url, comic_key):
+    """
+    IMAGES_STOREからの画像の保存先の相対パス
+    (サイト名/カテゴリ/エントリ番号/ファイル名)
+    """
+    if "eromanga-yoru.com" in url:
+        save_dir = "eromanga_night"
+    else:
+        raise DropItem("unknown domain")
+    filename = url.rsplit("/", 1)[1]
+    return '{0}/{1}/{2}'.format(save_dir, comic_key, filename)
+
+
+def cover_rendition_path(renditions_store, comic_dir):
+    """
+    表紙サムネイルの保存先
+    input: comic_dir, IMAGES_STOREからの漫画ディレクトリの相対パス
+    """
+    return renditions_store / comic_dir / 'cover.jpg'
+
+
+def page_rendition_path(renditions_store, image_path):
+    """
+    表示サイズに縮小したページの保存先
+    input: image_path, IMAGES_STOREからの画像の相対パス
+    """
+    return renditions_store / image_path.parent / 'pages' / (
+        image_path.name + '.jpg')
+
+
+def render_image(src_path, dst_path, size, quality):
+    """
+    画像を指定サイズに縮小してJPEGで保存する
+    (wxPythonはWebPを読み込めないため、JPEGとする)
+    """
+    with Image.open(str(src_path)) as image:
+        # JPEGは縮小率に応じてデコード時に間引く(全画素をデコードしない)
+        image.draft('RGB', size)
+        image = image.convert('RGB').resize(size, Image.LANCZOS)
+    with replacing(dst_path) as tmp_path:
+        image.save(tmp_path, 'JPEG', quality=quality, optimize=True)
+
+
+def render_comic(images_store, renditions_store, image_paths, settings):
+    """
+    漫画1件分の表紙サムネイルと、表示サイズに縮小したページを作成する
+    ビューアの表示と同様に、表示サイズを許容量以上超過するページのみ縮小する
+    (それ以外のページはビューアが元画像をそのまま表示する)
+    input
+      image_paths: list, IMAGES_STOREからの画像の相対パス(先頭が表紙)
+      settings: scrapy settings
+    output: int, 作成した画像数
+    """
+    cover_size = tuple(map(int, settings.getlist('RENDITION_COVER_SIZE')))
+    page_size = tuple(map(int, settings.getlist('RENDITION_PAGE_SIZE')))
+    tolerance = settings.getint('RENDITION_PAGE_TOLERANCE')
+    quality = settings.getint('RENDITION_QUALITY')
+    image_paths = [Path(path) for path in image_paths]
+    num_rendered = 0
+    for idx, path in enumerate(image_paths):
+        src_path = images_store / path
+        if idx == 0:
+            render_image(src_path,
+                         cover_rendition_path(renditions_store, path.parent),
+                         cover_size, quality)
+            num_rendered += 1
+        # ヘッダのみ読み込んでサイズを確認する
+        with Image.open(str(src_path)) as image:
+            width, height = image.size
+        if width > page_size[0] + tolerance and \
+                height > page_size[1] + tolerance:
+            render_image(src_path,
+                         page_rendition_path(renditions_store, path),
+                         page_size, quality)
+            num_rendered += 1
+    return num_rendered
+
+
+def archive_path_of(comic_dir):
+    """
+    漫画1件分の画像をまとめたアーカイブ(無圧縮zip)のパス
+    (IMAGES_STORE/サイト名/カテゴリ/エントリ番号.cbz)
+    """
+    return comic_dir.with_name(comic_dir.name + '.cbz')
+
+
+def pack_comic(comic_dir, names):
+    """
+    漫画ごとのディレクトリの画像を1つのアーカイブにまとめ、ディレクトリを削除する
+    画像は圧縮済みのため無圧縮で格納し、ページ単位で直接読み込めるようにする
+    input
+      comic_dir: Path, 漫画ごとのディレクトリ
+      names: list, 格納する画像のファイル名(ページ順)
+    output: Path, アーカイブのパス
+    """
+    archive_path = archive_path_of(comic_dir)
+    with replacing(archive_path) as tmp_path:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_STORED) as archive:
+            for name in names:
+                archive.write(str(comic_dir / name), name)
+    shutil.rmtree(str(comic_dir))
+    return archive_path
+
+
+def natural_key(text):
+    """
+    数字部分を数値として比較するソートキー(ビューアのページ順と合わせる)
+    """
+    return [int(c) if c.isdigit() else c for c in re.split(r'(\d+)', text)]
+
+
+def build_manifest(images_store, image_paths):
+    """
+    保存した画像のマニフェストを作成する
+    幅・高さは画像のヘッダのみ読み込んで取得する
+    input: image_paths, IMAGES_STOREからの画像の相対パス
+    output: list, ファイル名順(自然順)の画像情報
+    """
+    manifest = []
+    for path in sorted(map(Path, image_paths),
+                       key=lambda path: natural_key(path.name)):
+        src_path = images_store / path
+        with Image.open(str(src_path)) as image:
+            width, height = image.size
+        manifest.append({
+            'name': path.name,
+            'size': src_path.stat().st_size,
+            'width': width,
+            'height': height,
+        })
+    return manifest
 
 
 class MongoPipeline(object):
     """
     MongoDB登録用パイプライン
+    itemはバッファに溜め、件数または時間の閾値でまとめて登録する
     """
-    # 重複itemを許容する数
-    MAX_DUP = 10
-    # 重複itemカウント用変数
-    duplicate_count = 0
 
     def open_spider(self, spider):
-        self.client = MongoClient('localhost', 27017)
+        settings = spider.settings
+        self.client = MongoClient(settings.get('MONGO_HOST'),
+                                  settings.getint('MONGO_PORT'))
+        db_name = settings.get('MONGO_DATABASE')
         # scrapy crawl GetComics で init_db 指定の場合
         # DBを初期化する
         if spider.init_db:
             print("----- initialized DB -----")
-            self.client.drop_database('ScrapedData')
-        self.db = self.client['ScrapedData']
+            self.client.drop_database(db_name)
+        self.db = self.client[db_name]
         self.collection = self.db['eromanga_night']
+        # 重複登録防止のためcomic_keyの一意インデックスを作成する
+        try:
+            self.collection.create_index('comic_key', unique=True)
+        except OperationFailure as e:
+            # 既存データに重複がある場合はアプリ起動時に解消される
+            spider.logger.warning(
+                'failed to create unique index on comic_key: %s', e)
+        # 中断したitemを検索するためのインデックス
+        self.collection.create_index('complete')
+        # 登録待ちのitemと、登録結果を通知するDeferredのリスト
+        self.pending = []
+        self.batch_size = settings.getint('MONGO_BATCH_SIZE')
+        # pipeline処理中のitem数に上限がある場合、それ以上はバッファに溜まらない
+        max_active_items = settings.getint('SCHEDULER_MAX_ACTIVE_ITEMS')
+        if max_active_items > 0:
+            self.batch_size = min(self.batch_size, max_active_items)
+        # DBへの書き込みをスレッドプールで実行するかどうか
+        self.async_writes = settings.getbool('MONGO_ASYNC_WRITES')
+        # バッチの書き込みを直列化するロック
+        self.write_lock = defer.DeferredLock()
+        # 件数が閾値に達しなくても一定時間ごとに登録する
+        self.flush_task = task.LoopingCall(self.flush, spider)
+        self.flush_task.start(settings.getfloat('MONGO_FLUSH_INTERVAL'),
+                              now=False)
 
     def close_spider(self, spider):
-        self.client.close()
+        if self.flush_task.running:
+            self.flush_task.stop()
+        # 書き込み中のバッチを含め、全ての登録が完了してからDBをクローズする
+        self.flush(spider)
+        dfd = self.write_lock.run(defer.succeed, None)
+        dfd.addBoth(lambda _: self.client.close())
+        return dfd
 
     def process_item(self, item, spider):
         comic_key = item['comic_key']
@@ -45,42 +242,426 @@ class MongoPipeline(object):
         image_urls = item['image_urls']
         if len(image_urls) == 0:
             raise DropItem('key:{0} contains no image urls.'.format(comic_key))
-        # 既にDB登録されたitemはスキップする。
-        # DB登録の有無はcomic_keyを使用して判断
-        comicExists = self.collection.find_one({'comic_key': comic_key})
-        if comicExists:
-            if spider.end_crawl:
-                print("----- detected duplicated item -----")
-                self.duplicate_count += 1
-            if self.duplicate_count >= self.MAX_DUP:
-                print("----- end crawling -----")
-                spider.stop_crawling()
-            raise DropItem('key:{0} is already exists.'.format(comic_key))
-        self.collection.insert_one(dict(item))
-        return item
+        # 修復対象のitemは登録済みのため、そのまま画像の保存に進む
+        if item.get('repair'):
+            spider.unfinished_keys.add(comic_key)
+            return item
+        # 登録完了後にitemを次のpipelineに渡す
+        dfd = defer.Deferred()
+        self.pending.append((item, dfd))
+        if self._batch_ready(spider):
+            self.flush(spider)
+        return dfd
+
+    def _batch_ready(self, spider):
+        """
+        登録待ちのitemをすぐに登録するかどうか
+        件数が閾値に達した場合に加え、pipeline処理中のitemが全て登録待ちの場合は
+        これ以上バッファに溜まらないため、タイマーを待たずに登録する
+        """
+        if len(self.pending) >= self.batch_size:
+            return True
+        scraper_slot = spider.crawler.engine.scraper.slot
+        if scraper_slot is None:
+            return False
+        return len(self.pending) >= scraper_slot.itemproc_size
+
+    def flush(self, spider):
+        """
+        登録待ちのitemをまとめてDBに登録し、結果を各Deferredに通知する
+        登録できなかったitemはDropItemとする
+        output: Deferred, 登録完了時に発火する
+        """
+        if not self.pending:
+            return defer.succeed(None)
+        batch, self.pending = self.pending, []
+        items = [item for item, _ in batch]
+        # 登録順を保つため、書き込みは一度に1バッチずつ行う
+        dfd = self.write_lock.run(self._write, items)
+        dfd.addCallbacks(self._batch_written, self._batch_failed,
+                         callbackArgs=(batch, spider), errbackArgs=(batch,))
+        return dfd
+
+    def _write(self, items):
+        """
+        バッチを登録する
+        非同期指定時はスレッドプールで実行し、reactorを止めない
+        """
+        if self.async_writes:
+            return threads.deferToThread(self._timed_write_batch, items)
+        return defer.maybeDeferred(self._timed_write_batch, items)
+
+    def _timed_write_batch(self, items):
+        """
+        バッチを登録し、登録にかかった時間と合わせて返す
+        """
+        start = time.perf_counter()
+        drops = self._write_batch(items)
+        return drops, time.perf_counter() - start
+
+    def _batch_written(self, result, batch, spider):
+        """
+        登録結果を各itemのDeferredに通知する(reactorスレッドで実行)
+        """
+        drops, elapsed = result
+        stats = spider.crawler.stats
+        stats.inc_value('comist/pipeline/mongo/count', len(batch))
+        stats.inc_value('comist/pipeline/mongo/sec', elapsed)
+        for item, dfd in batch:
+            comic_key = item['comic_key']
+            if comic_key in drops:
+                dfd.errback(DropItem(drops[comic_key]))
+                continue
+            # 以降の一覧ページで同じitemの詳細ページをリクエストしないよう登録
+            spider.known_keys.add(comic_key)
+            # 画像の保存が完了するまでは未完了として扱う
+            spider.unfinished_keys.add(comic_key)
+            dfd.callback(item)
+
+    def _batch_failed(self, failure, batch):
+        """
+        登録待ちのitemが処理されないまま残らないよう、全てエラーとする
+        """
+        for _, dfd in batch:
+            dfd.errback(failure)
+
+    def _write_batch(self, items):
+        """
+        itemをまとめてDBに登録する
+        comic_keyの一意インデックスとupsertにより、未登録の場合のみアトミックに登録する
+        (並列クロール時に他のプロセスが同じitemを登録した場合も重複しない)
+        input: list, ComicImageItem
+        output: dict, 登録しなかったitemのcomic_key -> 理由
+        """
+        drops = {}
+        docs = {}
+        for item in items:
+            comic_key = item['comic_key']
+            if comic_key in docs:
+                drops[comic_key] = 'key:{0} is duplicated in batch.'.format(
+                    comic_key)
+                continue
+            # comic_keyは検索条件から登録されるため除く
+            docs[comic_key] = {
+                k: v for k, v in dict(item).items() if k != 'comic_key'}
+            # 画像の保存完了時にManifestPipelineが更新する
+            docs[comic_key]['manifest'] = []
+            docs[comic_key]['complete'] = False
+        if not docs:
+            return drops
+        keys = list(docs)
+        requests = [
+            UpdateOne({'comic_key': key}, {'$setOnInsert': docs[key]},
+                      upsert=True)
+            for key in keys
+        ]
+        try:
+            result = self.collection.bulk_write(requests, ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            # 同時にupsertされた場合は一意インデックスによりキー重複エラーとなる
+            for error in e.details['writeErrors']:
+                if error['code'] != 11000:
+                    raise
+            upserted = {u['index']: u['_id'] for u in e.details['upserted']}
+        # 新規登録されなかったitemは既に登録済み
+        for idx, key in enumerate(keys):
+            if idx not in upserted:
+                drops[key] = 'key:{0} is already exists.'.format(key)
+        return drops
+
+
+class ManifestPipeline(object):
+    """
+    保存した画像のマニフェストとダウンロード完了フラグをDBに登録するパイプライン
+    (SaveComicPipelineの後、アーカイブ作成前に実行する)
+    MongoPipelineはcomplete=Falseで登録するため、画像の保存中に中断したitemは
+    DBのクエリで判別できる
+    """
+
+    def open_spider(self, spider):
+        settings = spider.settings
+        self.client = MongoClient(settings.get('MONGO_HOST'),
+                                  settings.getint('MONGO_PORT'))
+        self.collection = self.client[
+            settings.get('MONGO_DATABASE')]['eromanga_night']
+        self.images_store = Path(settings.get('IMAGES_STORE'))
+
+    def close_spider(self, spider):
+        self.client.close()
+
+    def process_item(self, item, spider):
+        image_paths = [image['path'] for image in item.get('images', [])]
+        # ファイルの読み込みとDBへの書き込みはスレッドプールで実行
+        dfd = threads.deferToThread(
+            self._update_manifest, item['comic_key'], item['num_images'],
+            image_paths)
+        dfd.addCallback(self._updated, item['comic_key'], spider)
+        dfd.addCallback(lambda _: item)
+        return dfd
+
+    def _update_manifest(self, comic_key, num_images, image_paths):
+        """
+        マニフェストと完了フラグを1回の更新でアトミックに登録する
+        output: bool, 全ページを保存したかどうか
+        """
+        manifest = build_manifest(self.images_store, image_paths)
+        complete = len(manifest) == num_images
+        self.collection.update_one(
+            {'comic_key': comic_key},
+            {'$set': {'manifest': manifest, 'complete': complete}})
+        return complete
+
+    def _updated(self, complete, comic_key, spider):
+        if complete:
+            spider.unfinished_keys.discard(comic_key)
 
 
 class SaveComicPipeline(ImagesPipeline):
 
+    def open_spider(self, spider):
+        super(SaveComicPipeline, self).open_spider(spider)
+        # 画像を再エンコードせず、ダウンロードしたまま保存するかどうか
+        self.store_original = spider.settings.getbool('IMAGES_STORE_ORIGINAL')
+        # 画像の実体をchecksumで管理する保存先(ローカル保存時のみ使用)
+        self.object_store = None
+        object_store = spider.settings.get('IMAGES_OBJECT_STORE')
+        if object_store and isinstance(self.store, FSFilesStore):
+            self.object_store = Path(object_store)
+        # 画像のデコード・checksum計算・書き込みを行うスレッドプール
+        # (0の場合はreactorスレッドで実行する)
+        self.worker_pool = None
+        self.num_queued = 0
+        num_workers = spider.settings.getint('IMAGES_WORKER_THREADS')
+        if num_workers > 0:
+            self.worker_pool = ThreadPool(minthreads=0, maxthreads=num_workers,
+                                          name='images')
+            self.worker_pool.start()
+
+    def close_spider(self, spider):
+        # 全itemの処理完了後に呼ばれるため、処理中の画像は無い
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
+
+    def media_downloaded(self, response, request, info, *, item=None):
+        """
+        ダウンロードした画像の保存処理をスレッドプールで実行し、reactorを止めない
+        処理待ちの画像数はstatsに記録する
+        """
+        parent = super(SaveComicPipeline, self).media_downloaded
+        if self.worker_pool is None:
+            return parent(response, request, info, item=item)
+        from twisted.internet import reactor
+        self._update_queue(info, 1)
+        dfd = threads.deferToThreadPool(reactor, self.worker_pool, parent,
+                                        response, request, info, item=item)
+        dfd.addBoth(self._dequeue, info)
+        return dfd
+
+    def _dequeue(self, result, info):
+        self._update_queue(info, -1)
+        return result
+
+    def _update_queue(self, info, count):
+        self.num_queued += count
+        stats = info.spider.crawler.stats
+        stats.set_value('comist/pipeline/image/queue', self.num_queued)
+        stats.max_value('comist/pipeline/image/queue_max', self.num_queued)
+
+    def inc_stats(self, spider, status):
+        # media_downloadedからワーカースレッドで呼ばれる
+        parent = super(SaveComicPipeline, self).inc_stats
+        if threadable.isInIOThread():
+            parent(spider, status)
+        else:
+            from twisted.internet import reactor
+            reactor.callFromThread(parent, spider, status)
+
+    def _inc_stats(self, info, key, count=1):
+        """
+        statsはスレッドセーフではないため、reactorスレッドで更新する
+        """
+        stats = info.spider.crawler.stats
+        if threadable.isInIOThread():
+            stats.inc_value(key, count)
+        else:
+            from twisted.internet import reactor
+            reactor.callFromThread(stats.inc_value, key, count)
+
     def get_media_requests(self, item, info):
         for image_url in item['image_urls']:
-            yield scrapy.Request(image_url, meta={'comic_key': item["comic_key"]})
+            # 画像はHTTPキャッシュの対象外とする
+            yield scrapy.Request(image_url,
+                                 meta={'comic_key': item["comic_key"],
+                                       'image_request': True,
+                                       'dont_cache': True,
+                                       'repair': item.get('repair')})
+
+    def file_path(self, request, response=None, info=None, *, item=None):
+        """
+        画像の保存先
+        保存済みかどうかの確認と、後続のpipelineに渡す画像のパスにも使用される
+        """
+        return image_path_of(request.url, request.meta['comic_key'])
+
+    def media_to_download(self, request, info, *, item=None):
+        """
+        修復時は保存済みの画像を、保存日時によらずダウンロードしない
+        """
+        if not request.meta.get('repair') or \
+                not isinstance(self.store, FSFilesStore):
+            return super(SaveComicPipeline, self).media_to_download(
+                request, info, item=item)
+        path = self.file_path(request, info=info)
+        if not (Path(self.store.basedir) / path).exists():
+            return None
+        self.inc_stats(info.spider, 'uptodate')
+        return {'url': request.url, 'path': path, 'checksum': None,
+                'status': 'uptodate'}
+
+    def image_downloaded(self, response, request, info, *, item=None):
+        start = time.perf_counter()
+        try:
+            return self._image_downloaded(response, request, info)
+        finally:
+            self._inc_stats(info, 'comist/pipeline/image/count')
+            self._inc_stats(info, 'comist/pipeline/image/sec',
+                            time.perf_counter() - start)
 
-    def image_downloaded(self, response, request, info):
+    def _image_downloaded(self, response, request, info):
         checksum = None
-        if "eromanga-yoru.com" in request._url:
-            save_dir = "eromanga_night"
-        else:
-            raise DropItem("unknown domain")
-        for path, image, buf in self.get_images(response, request, info):
+        path = self.file_path(request, response=response, info=info)
+        if self.store_original:
+            return self._persist_original(response, path, info)
+        for _, image, buf in self.get_images(response, request, info):
             if checksum is None:
                 buf.seek(0)
                 checksum = md5sum(buf)
             width, height = image.size
-            filename = request._url.rsplit("/", 1)[1]
-            path = '{0}/{1}/{2}'.format(save_dir,
-                                        response.meta['comic_key'], filename)
-            self.store.persist_file(
-                path, buf, info,
-                meta={'width': width, 'height': height})
+            self._persist(path, buf, checksum, info,
+                          meta={'width': width, 'height': height})
+        return checksum
+
+    def _persist_original(self, response, path, info):
+        """
+        ダウンロードした画像を再エンコードせずにそのまま保存する
+        幅・高さは画像のヘッダのみ読み込んで取得する(画素データはデコードしない)
+        """
+        buf = BytesIO(response.body)
+        checksum = md5sum(buf)
+        buf.seek(0)
+        try:
+            with Image.open(buf) as image:
+                width, height = image.size
+        except OSError:
+            raise ImageException(
+                'Image cannot be identified: {0}'.format(response.url))
+        buf.seek(0)
+        self._persist(path, buf, checksum, info,
+                      meta={'width': width, 'height': height})
         return checksum
+
+    def _persist(self, path, buf, checksum, info, meta):
+        """
+        画像を保存する
+        object store使用時は画像の実体をchecksumをキーに1つだけ保存し、
+        漫画ごとのディレクトリにはハードリンクを作成する
+        (同じ画像を保持済みの場合は書き込みを省略する)
+        """
+        if self.object_store is None:
+            self.store.persist_file(path, buf, info, meta=meta)
+            return
+        object_path = object_path_of(self.object_store, checksum)
+        if object_path.exists():
+            self._inc_stats(info, 'comist/pipeline/image/dedup')
+        else:
+            with replacing(object_path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.write(buf.getvalue())
+        link_object(object_path, Path(self.store.basedir) / path)
+
+
+class RenditionPipeline(object):
+    """
+    保存した画像から、一覧表示用の表紙サムネイルと
+    ビューア表示サイズに縮小したページを作成するパイプライン
+    (SaveComicPipelineの後に実行する)
+    """
+
+    def open_spider(self, spider):
+        settings = spider.settings
+        self.settings = settings
+        self.images_store = Path(settings.get('IMAGES_STORE'))
+        # 空文字の場合は作成しない
+        renditions_store = settings.get('RENDITIONS_STORE')
+        self.renditions_store = Path(renditions_store) \
+            if renditions_store else None
+
+    def process_item(self, item, spider):
+        if self.renditions_store is None or not item.get('images'):
+            return item
+        # 画像のデコード・縮小はreactorを止めないようスレッドプールで実行
+        image_paths = [image['path'] for image in item['images']]
+        dfd = threads.deferToThread(self._timed_render, image_paths)
+        dfd.addCallbacks(self._rendered, self._render_failed,
+                         callbackArgs=(spider,),
+                         errbackArgs=(item, spider))
+        dfd.addCallback(lambda _: item)
+        return dfd
+
+    def _timed_render(self, image_paths):
+        start = time.perf_counter()
+        num_rendered = render_comic(self.images_store, self.renditions_store,
+                                    image_paths, self.settings)
+        return num_rendered, time.perf_counter() - start
+
+    def _rendered(self, result, spider):
+        num_rendered, elapsed = result
+        stats = spider.crawler.stats
+        stats.inc_value('comist/pipeline/rendition/count', num_rendered)
+        stats.inc_value('comist/pipeline/rendition/sec', elapsed)
+
+    def _render_failed(self, failure, item, spider):
+        """
+        縮小画像が無くてもビューアは元画像を表示できるため、itemは破棄しない
+        """
+        spider.logger.warning('failed to render key:%s: %s',
+                              item['comic_key'], failure.getErrorMessage())
+
+
+class ArchivePipeline(object):
+    """
+    全ページを保存した漫画の画像を1つのアーカイブにまとめるパイプライン
+    (縮小画像の作成後に実行する)
+    """
+
+    def open_spider(self, spider):
+        settings = spider.settings
+        self.enabled = settings.getbool('IMAGES_ARCHIVE')
+        self.images_store = Path(settings.get('IMAGES_STORE'))
+
+    def process_item(self, item, spider):
+        if not self.enabled or not item.get('images'):
+            return item
+        # ダウンロードに失敗したページがある場合は、後から補えるよう
+        # ディレクトリのまま残す
+        if len(item['images']) < item['num_images']:
+            return item
+        paths = [Path(image['path']) for image in item['images']]
+        comic_dir = self.images_store / paths[0].parent
+        dfd = threads.deferToThread(
+            pack_comic, comic_dir, [path.name for path in paths])
+        dfd.addCallbacks(self._packed, self._pack_failed,
+                         callbackArgs=(spider,), errbackArgs=(item, spider))
+        dfd.addCallback(lambda _: item)
+        return dfd
+
+    def _packed(self, archive_path, spider):
+        spider.crawler.stats.inc_value('comist/pipeline/archive/count')
+
+    def _pack_failed(self, failure, item, spider):
+        """
+        アーカイブの作成に失敗してもディレクトリの画像は残るため、itemは破棄しない
+        """
+        spider.logger.warning('failed to pack key:%s: %s',
+                              item['comic_key'], failure.getErrorMessage())
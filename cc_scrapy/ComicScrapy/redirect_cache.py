@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import json
+import os.path as osp
+import time
+
+from ComicScrapy.atomic_file import replacing
+
+
+class RedirectCache(object):
+    """
+    連作URLのリダイレクト先を保存するキャッシュ
+    キーは div.box_rensaku のhref(未解決のURL)、値は(リダイレクト先URL, 取得時刻)
+    """
+
+    def __init__(self, path, ttl):
+        """
+        path: str, キャッシュファイルのパス(json)
+        ttl: int, キャッシュの有効期間[sec] (0以下の場合は無期限)
+        """
+        self.path = path
+        self.ttl = ttl
+        self.entries = self._load()
+        # 未保存のエントリ
+        self.new_entries = {}
+
+    def _load(self):
+        """
+        キャッシュファイルを読み込む
+        ファイルが存在しない、または壊れている場合は空のキャッシュとする
+        """
+        if not osp.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return {}
+
+    def _expired(self, fetched_at):
+        """
+        有効期間切れの判定
+        """
+        if self.ttl <= 0:
+            return False
+        return time.time() - fetched_at > self.ttl
+
+    def get(self, url):
+        """
+        リダイレクト先URLを返す
+        未登録、または有効期間切れの場合はNoneを返す
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        resolved_url, fetched_at = entry
+        if self._expired(fetched_at):
+            return None
+        return resolved_url
+
+    def set(self, url, resolved_url):
+        """
+        リダイレクト先URLを登録する
+        """
+        entry = [resolved_url, time.time()]
+        self.entries[url] = entry
+        self.new_entries[url] = entry
+
+    def save(self):
+        """
+        キャッシュをファイルに書き出す
+        並列クロール時に他のプロセスが保存したエントリを失わないよう、
+        ファイルを読み直してから未保存のエントリを追加する
+        有効期間切れのエントリは保存しない
+        """
+        if not self.new_entries:
+            return
+        entries = self._load()
+        entries.update(self.new_entries)
+        entries = {
+            url: entry for url, entry in entries.items()
+            if not self._expired(entry[1])
+        }
+        with replacing(self.path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+        self.entries = entries
+        self.new_entries = {}
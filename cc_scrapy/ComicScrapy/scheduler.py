@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+from scrapy.core.scheduler import Scheduler
+
+
+class BackpressureScheduler(Scheduler):
+    """
+    未処理のリクエストを常にディスクキューに退避し、
+    pipeline処理中のitemが上限に達している間は新しいリクエストを払い出さないスケジューラ
+    """
+    # JOBDIR未指定時にディスクキューを置く一時ディレクトリ
+    tmp_dir = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super(BackpressureScheduler, cls).from_crawler(crawler)
+        scheduler.crawler = crawler
+        # pipeline処理中のitem数の上限(0以下の場合は制限なし)
+        scheduler.max_active_items = crawler.settings.getint(
+            'SCHEDULER_MAX_ACTIVE_ITEMS')
+        return scheduler
+
+    def _dqdir(self, jobdir):
+        if jobdir is None:
+            # JOBDIR未指定時も未処理のリクエストはメモリに溜めずディスクに退避する
+            self.tmp_dir = tempfile.mkdtemp(prefix='comist_queue_')
+            jobdir = self.tmp_dir
+        return super(BackpressureScheduler, self)._dqdir(jobdir)
+
+    def close(self, reason):
+        result = super(BackpressureScheduler, self).close(reason)
+        if self.tmp_dir is not None:
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        return result
+
+    def _needs_backout(self):
+        """
+        pipeline処理中(画像ダウンロード中を含む)のitem数が上限に達しているか
+        """
+        if self.max_active_items <= 0:
+            return False
+        scraper_slot = self.crawler.engine.scraper.slot
+        if scraper_slot is None:
+            return False
+        return scraper_slot.itemproc_size >= self.max_active_items
+
+    def next_request(self):
+        # 処理中の漫画を先に完了させるため、新しい詳細・一覧ページは取得しない
+        # (画像リクエストはpipelineから直接ダウンロードされるため影響しない)
+        if self._needs_backout():
+            return None
+        return super(BackpressureScheduler, self).next_request()
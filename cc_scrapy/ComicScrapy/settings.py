@@ -22,14 +22,15 @@ NEWSPIDER_MODULE = 'ComicScrapy.spiders'
 ROBOTSTXT_OBEY = True
 
 # Configure maximum concurrent requests performed by Scrapy (default: 16)
-CONCURRENT_REQUESTS = 1
+# HTMLページ用スロット(1) + 画像用スロット(IMAGE_SLOT_CONCURRENCY)
+CONCURRENT_REQUESTS = 5
 
 # Configure a delay for requests for the same website (default: 0)
 # See https://doc.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
 DOWNLOAD_DELAY = 5.0
 # The download delay setting will honor only one of:
-#CONCURRENT_REQUESTS_PER_DOMAIN = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 1
 #CONCURRENT_REQUESTS_PER_IP = 16
 
 # Disable cookies (enabled by default)
@@ -55,12 +56,50 @@ DOWNLOAD_DELAY = 5.0
 # DOWNLOADER_MIDDLEWARES = {
 #    'ComicScrapy.middlewares.ComicScrapyDownloaderMiddleware': 543,
 # }
+DOWNLOADER_MIDDLEWARES = {
+    'ComicScrapy.middlewares.SplitThrottleMiddleware': 543,
+}
+
+# 未処理のリクエストをディスクに退避し、処理中のitem数を制限するスケジューラ
+SCHEDULER = 'ComicScrapy.scheduler.BackpressureScheduler'
+# pipeline処理中(画像ダウンロード中を含む)のitem数の上限(0以下の場合は制限なし)
+SCHEDULER_MAX_ACTIVE_ITEMS = 2
+
+# 画像リクエストをHTMLページと別スロットでスロットリングする
+# (無効の場合は全リクエストがDOWNLOAD_DELAYで直列に処理される)
+SPLIT_THROTTLE_ENABLED = True
+# 画像スロットの並列数
+IMAGE_SLOT_CONCURRENCY = 4
+# 画像スロットのディレイ下限[sec]
+IMAGE_SLOT_DELAY = 0.5
+# 画像スロットのディレイ上限[sec]
+IMAGE_SLOT_MAX_DELAY = 10.0
+# 画像スロットで並列に処理するリクエスト数の目標値
+IMAGE_SLOT_TARGET_CONCURRENCY = 2.0
 
 # Enable or disable extensions
 # See https://doc.scrapy.org/en/latest/topics/extensions.html
 # EXTENSIONS = {
 #    'scrapy.extensions.telnet.TelnetConsole': None,
 # }
+EXTENSIONS = {
+    'ComicScrapy.extensions.CrawlMetrics': 500,
+    'ComicScrapy.extensions.ProgressEvents': 510,
+}
+
+# クロールのメトリクスをjsonファイルに定期的に書き出す
+METRICS_ENABLED = True
+METRICS_PATH = '../data/metrics/crawl_metrics.json'
+# 書き出し間隔[sec]
+METRICS_INTERVAL = 5.0
+
+# 進捗イベント(JSON-lines)の送信先 host:port
+# (GUIからのクロール時に指定される。空文字の場合は送信しない)
+PROGRESS_ADDRESS = ''
+# 送信元のクロールの識別名
+PROGRESS_NAME = 'GetComics'
+# キューの状態などの送信間隔[sec]
+PROGRESS_INTERVAL = 1.0
 
 # Configure item pipelines
 # See https://doc.scrapy.org/en/latest/topics/item-pipeline.html
@@ -69,9 +108,57 @@ DOWNLOAD_DELAY = 5.0
 # }
 ITEM_PIPELINES = {
     'ComicScrapy.pipelines.SaveComicPipeline': 500,
+    'ComicScrapy.pipelines.ManifestPipeline': 550,
     'ComicScrapy.pipelines.MongoPipeline': 300,
+    'ComicScrapy.pipelines.RenditionPipeline': 600,
+    'ComicScrapy.pipelines.ArchivePipeline': 700,
 }
 IMAGES_STORE = '../data/Comics'
+# ダウンロードした画像を再エンコードせずにそのまま保存する
+# (Falseの場合はPillowでデコードし、JPEGに再エンコードして保存する)
+IMAGES_STORE_ORIGINAL = True
+# 画像の実体をchecksum(md5)で一元管理する保存先
+# 漫画ごとのディレクトリにはハードリンクを作成し、同じ画像は重複して保存しない
+# (空文字の場合は漫画ごとのディレクトリに直接保存する)
+IMAGES_OBJECT_STORE = '../data/ImageObjects'
+# 画像のデコード・checksum計算・書き込みを行うスレッド数
+# (0の場合はreactorスレッドで実行し、その間は他のリクエストの処理が止まる)
+IMAGES_WORKER_THREADS = 4
+# 漫画ごとの画像を1つの無圧縮zip(エントリ番号.cbz)にまとめる
+# (ファイル数が減りバックアップやビューアの読み込みが速くなる)
+IMAGES_ARCHIVE = False
+# 一覧表示用の表紙サムネイルと、ビューア表示サイズに縮小したページの保存先
+# (空文字の場合は作成しない)
+RENDITIONS_STORE = '../data/Renditions'
+# 表紙サムネイルのサイズ (width, height)
+RENDITION_COVER_SIZE = (180, 260)
+# ビューアの表示サイズ (width, height)
+RENDITION_PAGE_SIZE = (712, 1024)
+# 表示サイズ超過の許容量 (これ以下の超過は縮小しない)
+RENDITION_PAGE_TOLERANCE = 15
+# 縮小画像のJPEG品質
+RENDITION_QUALITY = 85
+
+# 登録先のMongoDB
+MONGO_HOST = 'localhost'
+MONGO_PORT = 27017
+MONGO_DATABASE = 'ScrapedData'
+# まとめて登録するitem数
+# (SCHEDULER_MAX_ACTIVE_ITEMSが小さい場合はその値を上限とし、
+#  pipeline処理中のitemが全て登録待ちになった時点でも登録する)
+MONGO_BATCH_SIZE = 20
+# 登録待ちのitemを登録する間隔[sec]
+MONGO_FLUSH_INTERVAL = 1.0
+# DBへの書き込みをスレッドプールで実行し、reactorを止めない
+MONGO_ASYNC_WRITES = True
+
+# 連作URLのリダイレクト先キャッシュ
+CONTINUOUS_CACHE_PATH = '../data/continuous_cache.json'
+# キャッシュの有効期間[sec] (0以下の場合は無期限)
+CONTINUOUS_CACHE_TTL = 60 * 60 * 24 * 30
+
+# カテゴリごとのクロール済み最新comic_keyの保存先
+CRAWL_WATERMARK_PATH = '../data/crawl_watermark.json'
 
 
 # Enable and configure the AutoThrottle extension (disabled by default)
@@ -94,3 +181,10 @@ IMAGES_STORE = '../data/Comics'
 # HTTPCACHE_DIR = 'httpcache'
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+# 一覧・詳細ページをキャッシュし、ETag/Last-Modifiedで再検証する
+# (変更がなければ304応答となり、キャッシュからparseされる)
+# 画像リクエストはSaveComicPipelineでキャッシュ対象外にしている
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'scrapy.extensions.httpcache.RFC2616Policy'
+HTTPCACHE_EXPIRATION_SECS = 0
+HTTPCACHE_GZIP = True
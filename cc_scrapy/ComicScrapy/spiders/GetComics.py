@@ -2,12 +2,13 @@
 import scrapy
 from scrapy.spiders import CrawlSpider, Rule
 from scrapy.linkextractors import LinkExtractor
-from scrapy.exceptions import CloseSpider
 from ComicScrapy.items import ComicImageItem
+from ComicScrapy.pipelines import archive_path_of, image_path_of
+from ComicScrapy.redirect_cache import RedirectCache
+from ComicScrapy.watermark import CrawlWatermark
 import urllib
+from pathlib import Path
 from pymongo import MongoClient
-import requests
-from requests.exceptions import MissingSchema
 import re
 from ComicScrapy.site_data import CssSelectors as Css
 from ComicScrapy.site_data import REpattern as Ptn
@@ -53,7 +54,8 @@ class GetComicsSpider(scrapy.Spider):
     }
     # リクエストヘッダ情報
     headers = {
-        # "Cache-Control": "max-age=0",
+        # HTTPキャッシュの有効期限によらず、必ずサーバーに再検証させる
+        "Cache-Control": "max-age=0",
         # "Connection": "keep-alive",
         "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
                        "AppleWebKit/537.36 (KHTML, like Gecko) "
@@ -62,23 +64,35 @@ class GetComicsSpider(scrapy.Spider):
         "Accept-Language": "ja,en-US;q=0.9,en;q=0.8",
     }
 
+    # DBの画像情報から修復対象のitemを作成するためのダミーリクエスト
+    repair_url = "data:,"
+    # 修復時にDBから読み込むitemのフィールド
+    repair_fields = [
+        "comic_key", "entry_url", "title", "author", "image_urls",
+        "continuous_work", "num_images", "tags", "category", "rate",
+    ]
+
     def __init__(self, category="", test_crawl=0,
-                 init_db=0, end_crawl=0, *args, **kwargs):
+                 init_db=0, end_crawl=0, repair=0, *args, **kwargs):
         """
         scrapy crawl GetComics 引数
         category: str, カンマ区切りでカテゴリを指定
         test_crawl: int, クロールの機能確認実施フラグ
                          trueの場合、自動で init_db=true となる
         init_db: int, DBの初期化フラグ
-        end_crawl: int, 既にDB登録済みのアイテムを取得した際にcrawlを停止する
+        end_crawl: int, 前回クロール済みの位置に到達したカテゴリは
+                        以降の一覧ページを取得しない
+        repair: int, 一覧ページはクロールせず、DB登録済みで画像を
+                     保存しきれなかった漫画の不足分のみダウンロードする
         """
         super(GetComicsSpider, self).__init__(*args, **kwargs)
         # 引数はstr型となるため、キャストしてメンバ代入
         self.test_crawl = int(test_crawl)
         self.init_db = int(init_db)
         self.end_crawl = int(end_crawl)
-        # スクレイピング停止フラグ
-        self.end_flag = False
+        self.repair = int(repair)
+        if self.repair and self.init_db:
+            raise ValueError("repair and init_db cannot be used together.")
 
         # 機能確認では指定のエントリーのみクロールする
         if self.test_crawl:
@@ -103,6 +117,68 @@ class GetComicsSpider(scrapy.Spider):
                     urllib.parse.urljoin(self.base_url, "category/" + cat)
                 )
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(GetComicsSpider, cls).from_crawler(
+            crawler, *args, **kwargs)
+        # 連作URLのリダイレクト先キャッシュを読み込む
+        spider.redirect_cache = RedirectCache(
+            crawler.settings.get('CONTINUOUS_CACHE_PATH'),
+            crawler.settings.getint('CONTINUOUS_CACHE_TTL'),
+        )
+        # DB登録済みのcomic_keyを読み込み、詳細ページのリクエストを省略する
+        spider.known_keys = spider._load_known_keys()
+        # DBに登録し、画像の保存が完了していないcomic_key
+        # (終了時にstatsで報告し、GUIが削除または修復対象とする)
+        spider.unfinished_keys = set()
+        # カテゴリごとのクロール済み最新comic_keyを読み込む
+        spider.watermark = CrawlWatermark(
+            crawler.settings.get('CRAWL_WATERMARK_PATH'),
+            reset=bool(spider.init_db),
+        )
+        return spider
+
+    def closed(self, reason):
+        """
+        spider終了時にリダイレクト先キャッシュとクロール済み位置を保存し、
+        画像を保存しきれなかったitemを報告する
+        """
+        self.redirect_cache.save()
+        self.watermark.save()
+        stats = self.crawler.stats
+        stats.set_value('comist/incomplete_keys', sorted(self.unfinished_keys))
+        stats.set_value('comist/incomplete_items', len(self.unfinished_keys))
+        if self.unfinished_keys:
+            self.logger.warning('%d items are incomplete: %s',
+                                len(self.unfinished_keys),
+                                ', '.join(sorted(self.unfinished_keys)))
+
+    def start_requests(self):
+        if self.repair:
+            yield scrapy.Request(self.repair_url, callback=self.repair_parse,
+                                 dont_filter=True,
+                                 meta={'dont_cache': True,
+                                       'dont_obey_robotstxt': True})
+            return
+        # 新しいエントリは各カテゴリの1ページ目に載るため、
+        # 1ページ目もHTTPキャッシュを使わずサーバーに再検証させる
+        for url in self.start_urls:
+            yield scrapy.Request(url, callback=self.parse,
+                                 headers=self.headers, dont_filter=True)
+
+    def repair_parse(self, response):
+        """
+        画像を保存しきれなかった漫画をDBから読み込み、itemとして再投入する
+        保存済みの画像はSaveComicPipelineがダウンロードせずにスキップする
+        """
+        for doc in self._load_incomplete_docs():
+            item = ComicImageItem()
+            for field in self.repair_fields:
+                item[field] = doc[field]
+            item['repair'] = True
+            self.crawler.stats.inc_value('comist/repair_items')
+            yield item
+
     def parse(self, response):
         """
         一覧ページのリクエストを投げる
@@ -115,12 +191,21 @@ class GetComicsSpider(scrapy.Spider):
                                  headers=self.headers)
         # --------------------------------------------
 
-        # スクレイピング処理停止判定
-        self.close_spider_check()
-
         # 通常時処理 ----------------------------------
+        self.crawler.stats.inc_value('comist/listing_pages')
+        category = self._get_listing_category(response)
+        # 前回クロール時より新しいエントリを含むかどうか
+        has_newer = False
         # 詳細ページリクエストのループ
         for entry_url in response.css(Css.to_detail_page).extract():
+            comic_key = self._url_to_comic_key(entry_url)
+            if not self.test_crawl:
+                has_newer |= self.watermark.is_newer(category, comic_key)
+                self.watermark.update(category, comic_key)
+            # DB登録済みのitemは詳細ページをリクエストしない
+            if comic_key in self.known_keys:
+                continue
+            self.crawler.stats.inc_value('comist/entry_requests')
             yield scrapy.Request(entry_url,
                                  callback=self.entry_parse,
                                  headers=self.headers)
@@ -128,18 +213,25 @@ class GetComicsSpider(scrapy.Spider):
         # 一覧ページに次のページがある場合、リクエストを投げる
         next_link = response.css(Css.to_next_page).extract_first()
         if next_link is None:
+            self.watermark.complete(category)
+            return
+        elif self.end_crawl and not has_newer:
+            # 前回クロール済みの位置に到達したため、以降の一覧ページは取得しない
+            print("----- {0}: reached last crawled entry -----".format(
+                category))
+            self.watermark.complete(category)
             return
         else:
+            # 取得済みの詳細ページを先に処理するため、一覧ページの優先度は下げる
             yield scrapy.Request(next_link,
                                  callback=self.parse,
-                                 headers=self.headers)
+                                 headers=self.headers,
+                                 priority=-1)
 
     def entry_parse(self, response):
         """
         詳細ページからitem情報を取得
         """
-        # スクレイピング処理停止判定
-        self.close_spider_check()
         # TODO: 空ページの例外処理追加
         item = ComicImageItem()
         item['comic_key'] = self._get_commic_key(response)
@@ -149,24 +241,104 @@ class GetComicsSpider(scrapy.Spider):
         item['num_images'] = len(item['image_urls'])
         item['tags'] = self._get_tags(response)
         item['category'] = self._get_category(response)
-        item['continuous_work'] = self._get_continuous_work(response)
+        # 連作情報はリダイレクト先URLを解決しながら順に追加する
+        item['continuous_work'] = []
         # 初期レートに'unrated'を登録する
         item['rate'] = 'unrated'
-        return item
+        pending = self._get_continuous_work(response)
+        return self._next_continuous_request(item, pending)
+
+    def continuous_parse(self, response):
+        """
+        連作URLのリダイレクト先を取得し、次の連作URLをリクエストする
+        """
+        item = response.meta['item']
+        item['continuous_work'].append(response.url)
+        self.redirect_cache.set(response.meta['continuous_url'], response.url)
+        return self._next_continuous_request(item, response.meta['pending'])
+
+    def continuous_errback(self, failure):
+        """
+        連作URLのリクエスト失敗時は元のURLをそのまま連作情報とする
+        """
+        request = failure.request
+        self.logger.warning(
+            'failed to resolve continuous work: %s', request.url)
+        item = request.meta['item']
+        item['continuous_work'].append(request.url)
+        return self._next_continuous_request(item, request.meta['pending'])
+
+    def _load_known_keys(self):
+        """
+        DB登録済みのcomic_keyを取得する
+        DB初期化指定時は全て未登録として扱う
+        output: set, contains comic_key(str)
+        """
+        if self.init_db:
+            return set()
+        client = MongoClient(self.settings.get('MONGO_HOST'),
+                             self.settings.getint('MONGO_PORT'))
+        try:
+            db = client[self.settings.get('MONGO_DATABASE')]
+            collection = db['eromanga_night']
+            cursor = collection.find({}, {'comic_key': 1, '_id': 0})
+            return {doc['comic_key'] for doc in cursor if 'comic_key' in doc}
+        finally:
+            client.close()
+
+    def _load_incomplete_docs(self):
+        """
+        画像を保存しきれなかった漫画のドキュメントを取得する
+        完了フラグの無いドキュメント(旧形式)は、保存済みの画像数で判断する
+        output: generator, MongoDB Document
+        """
+        client = MongoClient(self.settings.get('MONGO_HOST'),
+                             self.settings.getint('MONGO_PORT'))
+        try:
+            collection = client[
+                self.settings.get('MONGO_DATABASE')]['eromanga_night']
+            for doc in collection.find({'complete': False}):
+                yield doc
+            for doc in collection.find({'complete': {'$exists': False}}):
+                if self._count_stored_images(doc) < doc['num_images']:
+                    yield doc
+        finally:
+            client.close()
+
+    def _count_stored_images(self, doc):
+        """
+        保存済みの画像数を取得する
+        アーカイブ済みの漫画は全ページ保存済みとする
+        """
+        images_store = Path(self.settings.get('IMAGES_STORE'))
+        comic_key = doc['comic_key']
+        if doc['image_urls'] and archive_path_of(
+                images_store / Path(image_path_of(
+                    doc['image_urls'][0], comic_key)).parent).exists():
+            return doc['num_images']
+        return sum(
+            (images_store / image_path_of(url, comic_key)).exists()
+            for url in doc['image_urls'])
 
-    def stop_crawling(self):
+    def _get_listing_category(self, response):
         """
-        スクレイピング停止フラグをTrueにする
-        (spider側からraiseする必要があるため,フラグで分岐して停止処理をコールする)
+        一覧ページのURLからクロール対象のカテゴリを取得する
+        input: response object
+        output: str, category in category_list
         """
-        self.end_flag = True
+        path = urllib.parse.urlparse(response.url).path.split("/")
+        if "category" in path:
+            return path[path.index("category") + 1]
+        return "front"
 
-    def close_spider_check(self):
+    def _url_to_comic_key(self, url):
         """
-        スクレイピング停止判定、停止処理
+        詳細ページのURLから漫画の識別子を取得する
+        input: str, url of detail page
+        output: str, like 'category/comic_id'
         """
-        if self.end_flag:
-            raise CloseSpider('duplicated item is detected, end crawling')
+        dir_name = url.split("/")[-2:]
+        return "/".join(dir_name)
 
     def _get_commic_key(self, response):
         """
@@ -174,9 +346,7 @@ class GetComicsSpider(scrapy.Spider):
         input: response object
         output: str, like 'category/comic_id'
         """
-        dir_name = response.url.split("/")[-2:]
-        comic_key = "/".join(dir_name)
-        return comic_key
+        return self._url_to_comic_key(response.url)
 
     def _get_entry_url(self, response):
         """
@@ -252,13 +422,36 @@ class GetComicsSpider(scrapy.Spider):
             # 連作がない場合は空リストを返して終了
             return cont_list
 
-        # リダイレクトしたURLを取得するために一度リクエストを送り、
-        # 返ってきたURLを連作情報として返す
-        for idx in range(len(cont_list)):
-            try:
-                response_redirect = requests.get(cont_list[idx])
-                cont_list[idx] = response_redirect.url
-            except MissingSchema:
-                # URLフラグメントが使われている場合は現在のURLで置換する
-                cont_list[idx] = response.url
         return cont_list
+
+    def _next_continuous_request(self, item, pending):
+        """
+        未解決の連作URLがあればリクエストを返し、全て解決済みならitemを返す
+        リダイレクト先はscrapyのリクエストとして取得するため、reactorを止めない
+        input: item, ComicImageItem
+               pending: list, 未解決の連作URL
+        output: scrapy.Request or ComicImageItem
+        """
+        while pending:
+            url = pending.pop(0)
+            if not urllib.parse.urlparse(url).scheme:
+                # URLフラグメントが使われている場合は現在のURLで置換する
+                item['continuous_work'].append(item['entry_url'])
+                continue
+            # 解決済みの連作URLはリクエストせずキャッシュから取得する
+            resolved_url = self.redirect_cache.get(url)
+            if resolved_url is not None:
+                item['continuous_work'].append(resolved_url)
+                continue
+            # 同じ連作URLは他のエントリからも参照されるため重複除外しない
+            # 取得途中のitemを早く完了させるため優先度を上げる
+            return scrapy.Request(url,
+                                  callback=self.continuous_parse,
+                                  errback=self.continuous_errback,
+                                  headers=self.headers,
+                                  dont_filter=True,
+                                  priority=1,
+                                  meta={'item': item,
+                                        'pending': pending,
+                                        'continuous_url': url})
+        return item
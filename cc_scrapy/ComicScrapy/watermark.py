@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import json
+import os.path as osp
+
+from ComicScrapy.atomic_file import replacing
+
+
+class CrawlWatermark(object):
+    """
+    カテゴリごとにクロール済みの最新comic_keyを保存する
+    一覧ページが前回の最新comic_keyより新しいエントリを含まなくなった時点で、
+    以降の一覧ページの取得を省略するために使用する
+    """
+
+    def __init__(self, path, reset=False):
+        """
+        path: str, 保存先ファイルのパス(json)
+        reset: bool, 前回までの記録を破棄する(DB初期化時に使用)
+        """
+        self.path = path
+        self.reset = reset
+        # 前回までのクロールで確認した最新comic_key
+        self.marks = {} if reset else self._load()
+        # 今回のクロールで確認した最新comic_key
+        self.latest = {}
+        # 一覧ページを最後まで(または前回の位置まで)取得したカテゴリ
+        self.completed = set()
+
+    def _load(self):
+        """
+        保存先ファイルを読み込む
+        ファイルが存在しない、または壊れている場合は空とする
+        """
+        if not osp.exists(self.path):
+            return {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return {}
+
+    @staticmethod
+    def _comic_id(comic_key):
+        """
+        comic_key末尾のエントリ番号を取得する
+        数値でない場合はNoneを返す
+        """
+        try:
+            return int(comic_key.split("/")[-1])
+        except ValueError:
+            return None
+
+    def _newer(self, comic_key, base_key):
+        """
+        comic_keyがbase_keyより新しいエントリかどうか
+        """
+        if base_key is None:
+            return True
+        comic_id = self._comic_id(comic_key)
+        base_id = self._comic_id(base_key)
+        if comic_id is None or base_id is None:
+            # 比較できない場合は新しいエントリとして扱う
+            return True
+        return comic_id > base_id
+
+    def is_newer(self, category, comic_key):
+        """
+        comic_keyが前回クロール時の最新comic_keyより新しいかどうか
+        """
+        return self._newer(comic_key, self.marks.get(category))
+
+    def update(self, category, comic_key):
+        """
+        今回のクロールで確認したcomic_keyを登録する
+        """
+        if self._newer(comic_key, self.latest.get(category)):
+            self.latest[category] = comic_key
+
+    def complete(self, category):
+        """
+        カテゴリの一覧ページ取得完了を登録する
+        完了したカテゴリのみ最新comic_keyを保存対象とする
+        """
+        self.completed.add(category)
+
+    def save(self):
+        """
+        取得完了したカテゴリの最新comic_keyをファイルに書き出す
+        途中で中断されたカテゴリは、未取得の一覧ページを次回取得するため更新しない
+        並列クロール時に他のプロセスが保存したカテゴリを失わないよう、
+        ファイルを読み直してから更新する
+        """
+        # 初期化指定時は他カテゴリの記録も含めて破棄する
+        marks = {} if self.reset else self._load()
+        updated = self.reset
+        for category in self.completed:
+            comic_key = self.latest.get(category)
+            if comic_key is None:
+                continue
+            if self._newer(comic_key, marks.get(category)):
+                marks[category] = comic_key
+                updated = True
+        if not updated:
+            return
+        with replacing(self.path) as tmp_path:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(marks, f, ensure_ascii=False)
+        self.reset = False
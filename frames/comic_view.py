@@ -1,5 +1,6 @@
 import wx
 import frames.const as c_
+from frames.pages import ComicPages
 from pathlib import Path
 # import for timehint
 from wx import Window, StaticBitmap, StaticText, BoxSizer, Button, Image
@@ -68,6 +69,8 @@ class ComicViewFrame(wx.Frame):
 
     def _init_artribute(self) -> None:
         self.image_path: Path = c_.COMIC_PATH / self.target_site
+        self.rendition_path: Path = c_.RENDITION_PATH / self.target_site
+        self.pages: ComicPages = None
         self.image_size: tuple = c_.IMAGE_SIZE
         self.image_height: int = c_.IMAGE_HEIGHT
         self.image_width: int = c_.IMAGE_WIDTH
@@ -88,6 +91,7 @@ class ComicViewFrame(wx.Frame):
         n_page = min(max_idx, n_page)
         self.entry_panel.update_entry_list(search_result, n_page)
         # 画面を閉じる
+        self.pages.close()
         self.Destroy()
 
     def on_key(self, event) -> None:
@@ -180,7 +184,7 @@ class ComicViewFrame(wx.Frame):
         """
         self._init_imglist_and_idxs()
         # 描画のためにBitmapオブジェクトに変換する必要あり
-        image = wx.Image(str(self.image_list[0]))
+        image = self._load_page_image(0)
         image = self._scale_bitmap_image(image)
         bitmap = image.ConvertToBitmap()
         self.comic_img: StaticBitmap = wx.StaticBitmap(
@@ -191,14 +195,27 @@ class ComicViewFrame(wx.Frame):
         漫画画像のリストとページングに使用するインデックスを初期化
         """
         entry_path = self.image_path / self.entry_info["comic_key"]
-        self.image_list = list(entry_path.glob("*"))
-        self.image_list = list(map(str, self.image_list))
-        # 画像をソート
-        self.image_list.sort(key=c_.natural_keys)
+        # 連作の切り替え時は前の漫画のアーカイブを閉じる
+        if self.pages is not None:
+            self.pages.close()
+        self.pages = ComicPages(entry_path, self.entry_info.get("manifest"))
+        # ページ順にソート済みの画像ファイル名
+        self.image_list = self.pages.names
         self.comic_idx = 0
         self.idx_max = len(self.image_list) - 1
         self.idx_min = 0
 
+    def _load_page_image(self, idx: int) -> Image:
+        """
+        ページの画像を読み込む
+        表示サイズに縮小済みの画像があればそちらを使用する
+        """
+        rendition = self.rendition_path / self.entry_info["comic_key"] / \
+            "pages" / (self.image_list[idx] + ".jpg")
+        if rendition.exists():
+            return wx.Image(str(rendition))
+        return self.pages.load(idx)
+
     def _init_rate_rdbtn(self) -> None:
         """
         レート登録用ラジオボタンを初期化
@@ -358,7 +375,7 @@ class ComicViewFrame(wx.Frame):
         漫画画像とインデックスを更新
         """
         self._init_imglist_and_idxs()
-        image = wx.Image(str(self.image_list[0]))
+        image = self._load_page_image(0)
         image = image.Scale(
             self.image_width, self.image_height, wx.IMAGE_QUALITY_HIGH)
         bitmap = image.ConvertToBitmap()
@@ -462,7 +479,7 @@ class ComicViewFrame(wx.Frame):
             self.disable_page_btn("next")
         window_list = self.layout.GetChildren()
         comic_window = window_list[1].GetWindow()
-        image = wx.Image(str(self.image_list[self.comic_idx]))
+        image = self._load_page_image(self.comic_idx)
         image = self._scale_bitmap_image(image)
         bitmap = image.ConvertToBitmap()
         comic_window.SetBitmap(bitmap)
@@ -481,7 +498,7 @@ class ComicViewFrame(wx.Frame):
             self.disable_page_btn("prev")
         window_list = self.layout.GetChildren()
         comic_window = window_list[1].GetWindow()
-        image = wx.Image(str(self.image_list[self.comic_idx]))
+        image = self._load_page_image(self.comic_idx)
         image = self._scale_bitmap_image(image)
         bitmap = image.ConvertToBitmap()
         comic_window.SetBitmap(bitmap)
@@ -9,6 +9,26 @@ ComicDoc = Optional[Dict[str, Any]]
 
 # 漫画保存用のディレクトリパス
 COMIC_PATH = Path('data/Comics')
+# 表紙サムネイルと表示サイズに縮小したページの保存先
+# (漫画ごとに cover.jpg と pages/<元のファイル名>.jpg を持つ)
+RENDITION_PATH = Path('data/Renditions')
+# 一時停止したクロールの状態(scrapy JOBDIR)を保存するディレクトリパス
+JOB_PATH = Path('data/jobs')
+# クロールのメトリクス(json)を保存するディレクトリパス
+METRICS_PATH = Path('data/metrics')
+# メトリクス表示の更新間隔[msec]
+METRICS_REFRESH_MS = 2000
+# クロールログの表示行数の上限
+LOG_MAX_LINES = 5000
+# クロールログの表示の更新間隔[msec]
+LOG_FLUSH_MS = 200
+# クロールログの保存先 (Noneの場合は保存しない)
+CRAWL_LOG_PATH = Path('data/logs/crawl.log')
+# クロールログのローテーション (1ファイルの上限[byte], 保持する世代数)
+CRAWL_LOG_MAX_BYTES = 10 * 1024 * 1024
+CRAWL_LOG_BACKUPS = 5
+# 並列クロール時に起動するscrapyプロセス数の上限
+MAX_CRAWL_PROCESSES = 3
 # サムネイル用画像のパス
 NO_IMAGE_PATH = Path('data/no_image.png')
 # クロール完了通知用のイベント定義
@@ -2,11 +2,17 @@ import wx
 import sys
 from pathlib import Path
 from pymongo import MongoClient
-import subprocess
 from threading import Thread
-import os
-import re
+import shutil
+from datetime import datetime, timezone
+from bson import ObjectId
+import queue
+import json
 import frames.const as c_
+from frames.pages import archive_path_of
+from frames.launcher import WorkerPool
+from frames.logview import LogView
+from frames.progress import ProgressServer, format_progress
 
 
 class CrawlFrame(wx.Frame):
@@ -18,6 +24,10 @@ class CrawlFrame(wx.Frame):
         self.now_crawling = False
         # DB open
         self._open_DB()
+        # scrapyを読み込んで待機する子プロセス
+        # (クロール開始時にscrapyの起動を待たない)
+        self.worker_pool = WorkerPool(1)
+        self.worker_pool.prewarm()
 
         # CLOSEイベント
         self.Bind(wx.EVT_CLOSE, self.close_frame)
@@ -25,20 +35,41 @@ class CrawlFrame(wx.Frame):
         self.target_web_panel = TargetWebPanel(self)
         self.option_panel = CrawlOptionPanel(self)
 
+        # クロールの進捗表示(進捗バーとスループット・ETA)
+        self.progress_gauge = wx.Gauge(self, wx.ID_ANY, range=100)
+        self.progress_text = wx.StaticText(self, wx.ID_ANY, "")
         # 標準出力表示用のテキストボックス追加
         style = wx.TE_MULTILINE | wx.TE_READONLY | wx.HSCROLL
         self.log = wx.TextCtrl(self, wx.ID_ANY, style=style)
+        # クロールのメトリクス表示用のテキストボックス追加
+        self.metrics = wx.TextCtrl(self, wx.ID_ANY, style=style)
+        # メトリクス表示を定期的に更新する
+        self.metrics_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.update_metrics, self.metrics_timer)
+        self.metrics_timer.Start(c_.METRICS_REFRESH_MS)
+
+        self.log_layout = wx.BoxSizer(wx.VERTICAL)
+        self.log_layout.Add(self.progress_gauge, flag=wx.EXPAND)
+        self.log_layout.Add(self.progress_text,
+                            flag=wx.EXPAND | wx.TOP | wx.BOTTOM, border=5)
+        self.log_layout.Add(self.log, proportion=3, flag=wx.EXPAND)
+        self.log_layout.Add(self.metrics, proportion=1,
+                            flag=wx.EXPAND | wx.TOP, border=5)
 
         self.layout = wx.BoxSizer(wx.HORIZONTAL)
         self.layout.Add(self.target_web_panel, proportion=2,
                         flag=wx.EXPAND | wx.ALL, border=5)
         self.layout.Add(self.option_panel, proportion=2,
                         flag=wx.EXPAND | wx.ALL, border=5)
-        self.layout.Add(self.log, proportion=3,
+        self.layout.Add(self.log_layout, proportion=3,
                         flag=wx.EXPAND | wx.ALL, border=5)
 
         self.SetSizer(self.layout)
-        sys.stdout = self.log
+        # 出力はまとめて一定間隔で表示し、古い行は破棄する
+        self.log_view = LogView(
+            self, self.log, c_.LOG_MAX_LINES, c_.LOG_FLUSH_MS,
+            c_.CRAWL_LOG_PATH, c_.CRAWL_LOG_MAX_BYTES, c_.CRAWL_LOG_BACKUPS)
+        sys.stdout = self.log_view
         self.Centre()
         self.Show(True)
 
@@ -69,9 +100,76 @@ class CrawlFrame(wx.Frame):
             )
             dialog.ShowModal()
         else:
+            self.metrics_timer.Stop()
+            self.worker_pool.close()
+            self.log_view.close()
+            sys.stdout = sys.__stdout__
             self._close_DB()
             self.Destroy()
 
+    def update_metrics(self, event):
+        """
+        scrapyが書き出したメトリクスを読み込み、表示を更新する
+        """
+        scrape = getattr(self.option_panel, 'scrape', None)
+        if scrape is None:
+            return
+        # 進捗イベントから集計した進捗を表示する
+        percent, text = format_progress(scrape.progress.snapshot())
+        self.progress_gauge.SetValue(percent)
+        self.progress_text.SetLabel(text)
+        lines = []
+        for category, path in zip(scrape.cat_groups, scrape.metrics_paths):
+            try:
+                with open(str(path), encoding='utf-8') as f:
+                    metrics = json.load(f)
+            except (OSError, ValueError):
+                # まだ書き出されていない場合は表示しない
+                continue
+            lines.extend(format_metrics(",".join(category), metrics))
+        self.metrics.SetValue("\n".join(lines))
+
+
+def format_metrics(name, metrics):
+    """
+    メトリクスを表示用の文字列リストに変換する
+    """
+    def mean(data):
+        return data['sum'] / data['count'] if data['count'] else 0.0
+
+    latency = metrics['latency']
+    pipeline = metrics['pipeline']
+    elapsed = max(metrics['elapsed_sec'], 1e-6)
+    return [
+        "[{0}] {1}  {2:.0f} s".format(name, metrics['state'], elapsed),
+        "  items: {0} scraped / {1} dropped ({2:.2f} items/min)".format(
+            metrics['items_scraped'], metrics['items_dropped'],
+            metrics['items_scraped'] * 60 / elapsed),
+        "  queue: {0} queued / {1} in progress / {2} images to save".format(
+            metrics['queue_depth'], metrics['in_progress'],
+            metrics.get('image_queue', 0)),
+        "  html: {0} responses, {1} listing pages, {2:.2f} s avg".format(
+            metrics['html_responses'], metrics['listing_pages'],
+            mean(latency['html'])),
+        "  image: {0} responses, {1:.1f} MB, {2:.2f} s avg".format(
+            metrics['image_responses'], metrics['image_bytes'] / 1e6,
+            mean(latency['image'])),
+        "  pipeline: mongo {0:.1f} ms/item, image {1:.1f} ms/image, "
+        "rendition {2:.1f} ms/image".format(
+            mean(pipeline['mongo']) * 1000, mean(pipeline['image']) * 1000,
+            mean(pipeline.get('rendition', {'count': 0})) * 1000),
+    ]
+
+
+def format_stats(stats):
+    """
+    クロール終了時のscrapyのstatsを表示用の文字列に変換する
+    """
+    return "finished ({0}): {1} stored, {2} dropped, {3:.0f} s\n".format(
+        stats.get("finish_reason", "-"), stats.get("item_scraped_count", 0),
+        stats.get("item_dropped_count", 0),
+        stats.get("elapsed_time_seconds", 0))
+
 
 class TargetWebPanel(wx.Panel):
     """
@@ -150,6 +248,7 @@ class CrawlOptionPanel(wx.Panel):
         }
     }
     image_path = c_.COMIC_PATH
+    job_path = c_.JOB_PATH
 
     def __init__(self, parent):
         super().__init__(parent, wx.ID_ANY)
@@ -169,6 +268,11 @@ class CrawlOptionPanel(wx.Panel):
         # クロール開始ボタン
         self.crawl_start_button = wx.Button(self, wx.ID_ANY, 'START')
         self.crawl_start_button.Bind(wx.EVT_BUTTON, self.click_start_button)
+        # クロール一時停止ボタン
+        # クロール中のみ有効のためボタン無効化
+        self.crawl_pause_button = wx.Button(self, wx.ID_ANY, 'PAUSE')
+        self.crawl_pause_button.Bind(wx.EVT_BUTTON, self.click_pause_button)
+        self.crawl_pause_button.Disable()
         # クロール停止ボタン
         # クロール中のみ有効のためボタン無効化
         self.crawl_stop_button = wx.Button(self, wx.ID_ANY, 'STOP')
@@ -184,6 +288,7 @@ class CrawlOptionPanel(wx.Panel):
         self.layout.Add(self.option_layout,
                         flag=wx.ALIGN_CENTER | wx.TOP | wx.BOTTOM, border=40)
         self.layout.Add(self.crawl_start_button, flag=wx.ALIGN_RIGHT)
+        self.layout.Add(self.crawl_pause_button, flag=wx.ALIGN_RIGHT)
         self.layout.Add(self.crawl_stop_button, flag=wx.ALIGN_RIGHT)
 
         self.SetSizer(self.layout)
@@ -215,14 +320,21 @@ class CrawlOptionPanel(wx.Panel):
         self.end_crawl_chkbox = wx.CheckBox(
             self, wx.ID_ANY, "Early termination"
         )
+        self.parallel_chkbox = wx.CheckBox(
+            self, wx.ID_ANY, "Parallel crawl"
+        )
         self.init_DB_chkbox.SetFont(font)
         self.end_crawl_chkbox.SetFont(font)
+        self.parallel_chkbox.SetFont(font)
         self.option_layout = wx.BoxSizer(wx.VERTICAL)
         self.option_layout.Add(
             self.init_DB_chkbox, flag=wx.ALIGN_CENTER | wx.BOTTOM, border=10
         )
         self.option_layout.Add(
-            self.end_crawl_chkbox, flag=wx.ALIGN_CENTER
+            self.end_crawl_chkbox, flag=wx.ALIGN_CENTER | wx.BOTTOM, border=10
+        )
+        self.option_layout.Add(
+            self.parallel_chkbox, flag=wx.ALIGN_CENTER
         )
 
     def set_categories_chkbox(self):
@@ -259,14 +371,16 @@ class CrawlOptionPanel(wx.Panel):
                 # クロール開始前処理
                 self.GetParent().now_crawling = True
                 self.crawl_start_button.Disable()
+                self.crawl_pause_button.Enable()
                 self.crawl_stop_button.Enable()
                 # threadに渡す引数準備
                 selected_cat = self.category_chkbox.GetCheckedStrings()
                 init_db = self.init_DB_chkbox.IsChecked()
                 early_term = self.end_crawl_chkbox.IsChecked()
+                cat_groups = self.split_categories(selected_cat)
                 # クロール処理開始
                 self.scrape = ScrapeThread(
-                    selected_cat, init_db, early_term, self
+                    cat_groups, init_db, early_term, self
                 )
 
         elif res == wx.ID_NO:
@@ -276,7 +390,19 @@ class CrawlOptionPanel(wx.Panel):
     def click_stop_button(self, event):
         """
         クロール停止ボタン
+        scrapyに停止を通知し、処理中のリクエストとアイテムを完了させてから終了する
+        停止処理中にもう一度押した場合は強制停止する
         """
+        if self.scrape.stopped():
+            dialog = wx.MessageDialog(
+                None, 'force stop without waiting for running downloads?',
+                style=wx.YES_NO
+            )
+            if dialog.ShowModal() == wx.ID_YES:
+                self.crawl_stop_button.Disable()
+                print("------ killing -------")
+                self.scrape.kill()
+            return
         dialog = wx.MessageDialog(
             None,
             'cancel crawling?',
@@ -285,53 +411,117 @@ class CrawlOptionPanel(wx.Panel):
         res = dialog.ShowModal()
         if res == wx.ID_YES:
             # クロール停止処理
-            # 予期せぬ操作を防止するため、先にクロール停止ボタンを無効化
-            self.crawl_stop_button.Disable()
+            # 後処理はクロール完了通知(crawl_postprocess)で行う
+            self.crawl_pause_button.Disable()
+            self.crawl_stop_button.SetLabel('FORCE STOP')
             print("------ canceling -------")
             self.scrape.stop()
-            self.scrape.join()      # thread処理停止まで待機
-            print("------ canceled -------")
 
-            # クロール停止完了後処理
-            # DL中断されたアイテムはDBから削除する
-            self.crawl_start_button.Enable()
-            self.remove_canceled_item_from_DB()
-            self.GetParent().now_crawling = False
-
-            # TODO: 余力があればストレージからも削除
+    def click_pause_button(self, event):
+        """
+        クロール一時停止ボタン
+        scrapyに中断を通知し、未処理のリクエストをJOBDIRに保存させる
+        次回同じカテゴリでSTARTした場合は中断した位置から再開する
+        """
+        # scrapyの終了処理中は他の操作を受け付けない
+        # ボタンの再有効化はクロール完了通知(crawl_postprocess)で行う
+        self.crawl_pause_button.Disable()
+        self.crawl_stop_button.Disable()
+        print("------ pausing -------")
+        self.scrape.pause()
 
     def crawl_postprocess(self, event):
         """
         クロール完了後処理
         フラグ管理とボタンの有効・無効化
         """
+        if self.scrape.stopped():
+            # 中断したクロールは再開しないため、保存された状態を破棄する
+            self.remove_job_dirs()
+            # 画像を保存しきれなかったアイテムはDBとストレージから削除する
+            self.cleanup_incomplete_items(remove=True)
+            print("------ canceled -------")
+        elif self.scrape.paused():
+            # 画像を保存しきれなかったアイテムは修復対象として残す
+            self.cleanup_incomplete_items(remove=False)
+            print("------ paused -------")
+            print("press START with the same categories to resume")
+        else:
+            # 完了したクロールの状態は不要なため破棄する
+            self.remove_job_dirs()
+            self.cleanup_incomplete_items(remove=False)
         self.GetParent().now_crawling = False
         self.crawl_start_button.Enable()
+        self.crawl_pause_button.Disable()
         self.crawl_stop_button.Disable()
+        self.crawl_stop_button.SetLabel('STOP')
 
-    def remove_canceled_item_from_DB(self):
+    def split_categories(self, selected_cat):
         """
-        ダウンロードを中断したアイテムをDBから削除する
+        scrapyプロセスごとのカテゴリリストを返す
+        並列クロール指定時はカテゴリを最大MAX_CRAWL_PROCESSES個に振り分ける
+        """
+        selected_cat = list(selected_cat)
+        if not self.parallel_chkbox.IsChecked():
+            return [selected_cat]
+        num_procs = min(c_.MAX_CRAWL_PROCESSES, len(selected_cat))
+        return [selected_cat[i::num_procs] for i in range(num_procs)]
+
+    def get_job_dir(self, selected_cat):
+        """
+        選択カテゴリに対応するクロール状態の保存先を返す
+        """
+        job_name = "+".join(sorted(selected_cat))
+        return self.job_path / job_name
+
+    def remove_job_dirs(self):
+        """
+        クロール状態の保存先を全て削除する
+        """
+        for job_dir in self.scrape.job_dirs:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def cleanup_incomplete_items(self, remove):
+        """
+        画像を保存しきれなかったアイテムを削除、または修復対象として残す
+        対象はscrapyが終了時に報告したアイテムとし、
+        強制停止などで報告が無い場合は今回登録した未完了のアイテムをDBから探す
+        input
+          remove: bool, Trueの場合はDBとストレージから削除する
+                        Falseの場合はDBにcomplete=Falseのまま残す
         """
-        # DB open
         col = self.GetParent().target_web_panel.radio_box.GetStringSelection()
-        # 最後にダウンロードされたitemを取得
-        # 日付順でソートした結果の先頭のみ取得
-        latest_item = self.GetParent().db[col].find().sort([
-            {"_id", -1}]).limit(1)
-        try:
-            # アイテムはdict型であるため、listでキャスト後要素を取り出す
-            latest_item = list(latest_item)[0]
-        except IndexError:
-            # DBにアイテムがない場合は何もせず終了
+        collection = self.GetParent().db[col]
+        keys, reported = self.scrape.incomplete_keys()
+        if not reported:
+            since = ObjectId.from_datetime(self.scrape.started_at)
+            cursor = collection.find(
+                {"complete": False, "_id": {"$gte": since}},
+                {"comic_key": 1})
+            keys.update(doc["comic_key"] for doc in cursor)
+        if not keys:
+            return
+        if not remove:
+            print("{0} incomplete items are kept for repair.".format(
+                len(keys)))
+            print("run 'scrapy crawl GetComics -a repair=1' in cc_scrapy")
             return
-        # ストレージに保存された画像の枚数を確認
-        comic_path = self.image_path / latest_item["comic_key"]
-        num_dl_images = len(list(comic_path.glob("*")))
-        if latest_item["num_images"] != num_dl_images:
-            # 最新アイテムがDL途中で中断された場合、DBから削除
-            self.GetParent().db[col].remove(
-                {"comic_key": latest_item["comic_key"]})
+        collection.delete_many({"comic_key": {"$in": sorted(keys)}})
+        for comic_key in keys:
+            self.remove_item_files(col, comic_key)
+        print("removed {0} incomplete items".format(len(keys)))
+
+    def remove_item_files(self, col, comic_key):
+        """
+        アイテムの画像(ディレクトリ・アーカイブ)と縮小画像を削除する
+        (object storeの画像は他のアイテムと共有されうるため残す)
+        """
+        comic_path = self.image_path / col / comic_key
+        shutil.rmtree(comic_path, ignore_errors=True)
+        archive_path = archive_path_of(comic_path)
+        if archive_path.exists():
+            archive_path.unlink()
+        shutil.rmtree(c_.RENDITION_PATH / col / comic_key, ignore_errors=True)
 
     def confirm_selected_categories(self):
         """
@@ -378,40 +568,82 @@ class ScrapeThread(Thread):
     Scraping thread
     """
 
-    def __init__(self, selected_cat, init_db, early_terminate, option_panel):
+    def __init__(self, cat_groups, init_db, early_terminate, option_panel):
         Thread.__init__(self)
         self.want_stop = False
-        # 取得対象カテゴリ(リスト)
-        self.category = ",".join(selected_cat)
+        self.want_kill = False
+        self.want_pause = False
+        # 今回のクロールで登録したアイテムを特定するための開始時刻
+        self.started_at = datetime.now(timezone.utc)
+        # クロールを実行中の子プロセス
+        self.workers = []
+        # 起動した子プロセス数、終了していない子プロセス数
+        self.num_started = 0
+        self.num_running = 0
+        # 各子プロセスの出力(終了時はNoneが入る)
+        self.output = queue.Queue()
+        # クロール終了時のscrapyのstats (PROGRESS_NAME -> stats)
+        self.stats = {}
+        # 待機中の子プロセス
+        self.worker_pool = option_panel.GetParent().worker_pool
+        # 取得対象カテゴリ(scrapyプロセスごとのリスト)
+        self.cat_groups = cat_groups
         # DB初期化フラグ
         self.init_db = init_db
         # 早期終了フラグ(取得済みアイテムヒット時)
         self.early_terminate = early_terminate
+        # クロール状態の保存先(一時停止・再開用、scrapyプロセスごと)
+        self.job_dirs = [option_panel.get_job_dir(c) for c in cat_groups]
+        # メトリクスの保存先(scrapyプロセスごと)
+        self.metrics_paths = [
+            c_.METRICS_PATH / (job_dir.name + ".json")
+            for job_dir in self.job_dirs
+        ]
         # 呼び出し元のcrawl frame
         self.option_panel = option_panel
+        # scrapyから進捗イベントを受信するソケット
+        # 漫画の登録結果はログとして出力に流す
+        self.progress = ProgressServer(self.output.put)
         self.start()
 
     def run(self):
         """
         thread実行
         """
-        wx.CallAfter(print, "------------------------")
-        wx.CallAfter(print, "---- start crawling ----")
-        wx.CallAfter(print, "------------------------")
-        wx.CallAfter(print, "")
+        # sys.stdoutはLogViewのため、このthreadから直接printできる
+        print("------------------------")
+        print("---- start crawling ----")
+        print("------------------------")
+        print("")
 
-        self.execute_crawling()
+        try:
+            self.execute_crawling()
+        finally:
+            self.progress.close()
+            # 次回のクロール用に子プロセスを起動しておく
+            self.worker_pool.prewarm()
 
-        wx.CallAfter(print, "------------------------")
-        wx.CallAfter(print, "----- end crawling -----")
-        wx.CallAfter(print, "------------------------")
-        wx.CallAfter(print, "")
+        print("------------------------")
+        print("----- end crawling -----")
+        print("------------------------")
+        print("")
 
     def stop(self):
         """
         thread停止要求
+        scrapyは処理中のリクエストとアイテムを完了させてから終了する
+        (一時停止と異なり、終了後にクロール状態は破棄される)
         """
         self.want_stop = True
+        for worker in self.workers:
+            worker.stop()
+
+    def kill(self):
+        """
+        thread強制停止要求
+        終了処理を待たずに子プロセスをkillする
+        """
+        self.want_kill = True
 
     def stopped(self):
         """
@@ -419,68 +651,154 @@ class ScrapeThread(Thread):
         """
         return self.want_stop
 
-    def execute_crawling(self):
+    def incomplete_keys(self):
         """
-        クロール開始
+        画像を保存しきれなかったアイテムのcomic_key
+        scrapyが終了時にstatsで報告したもの
+        output: tuple, (comic_keyのset, 全子プロセスから報告があったか)
         """
-        # scrapyに渡すコマンドを作成
-        cat_cmd = " -a category=" + self.category
+        keys = set()
+        for stats in self.stats.values():
+            keys.update(stats.get("comist/incomplete_keys", []))
+        return keys, len(self.stats) == self.num_started
 
-        # DB初期化コマンド
-        if self.init_db:
-            init_cmd = " -a init_db=1"
-        else:
-            init_cmd = ""
-
-        # 早期終了コマンド
-        if self.early_terminate:
-            term_cmd = " -a end_crawl=1"
-        else:
-            term_cmd = ""
+    def pause(self):
+        """
+        thread一時停止要求
+        scrapyは停止要求を受けると処理中のリクエストを完了させ、
+        未処理のリクエストをJOBDIRに保存して終了する
+        """
+        self.want_pause = True
+        for worker in self.workers:
+            worker.stop()
 
-        cmd = "scrapy crawl GetComics" + cat_cmd + init_cmd + term_cmd
-        for line in self.get_subprocess_output(cmd):
-            if self.stopped():
-                # スクレイピング中断処理
-                self.proc.kill()
-                return
-            # scrapyのDEBUG, WARNINGログはスキップ
-            if re.match(r'[0-9]{4}-[0-9]{2}-[0-9]{2}', line):
-                continue
-            wx.CallAfter(print, line, end="")
+    def paused(self):
+        """
+        thread一時停止要求取得
+        """
+        return self.want_pause
 
-        # クロール完了通知をcrawl option panelに送る
+    def execute_crawling(self):
+        """
+        クロール開始
+        """
+        parallel = len(self.cat_groups) > 1
+        init_db = self.init_db
+        # 前回クロール時のメトリクスを表示しないよう削除する
+        for path in self.metrics_paths:
+            if path.exists():
+                path.unlink()
+        if init_db:
+            # DB初期化時は一時停止したクロールを破棄する
+            for job_dir in self.job_dirs:
+                shutil.rmtree(job_dir, ignore_errors=True)
+        if init_db and parallel:
+            # 並列クロール時は各プロセスが個別にDBを初期化しないよう、
+            # カテゴリ指定なしのscrapyで一度だけ初期化する
+            self.start_worker([], True, None, None, "")
+            self.wait_processes()
+            init_db = False
+
+        if not (self.paused() or self.stopped()):
+            for category, job_dir, metrics_path in zip(
+                    self.cat_groups, self.job_dirs, self.metrics_paths):
+                if job_dir.exists():
+                    print("------ resume paused crawling -------")
+                # 並列クロール時はどのプロセスの出力か分かるようカテゴリを付ける
+                prefix = ""
+                if parallel:
+                    prefix = "[{0}] ".format(",".join(category))
+                self.start_worker(category, init_db, job_dir, metrics_path,
+                                  prefix)
+            self.wait_processes()
+
+        # クロール完了(停止・一時停止を含む)通知をcrawl option panelに送る
         evt = c_.CrawlCompletedEvt()
         wx.PostEvent(self.option_panel, evt)
 
-    def get_subprocess_output(self, cmd):
-        """
-        スクレイピングサブプロセスを実行
-        """
-        # 非同期処理でスクレイピングを実行
-        # TODO: Windows用の中断処理のテスト
-        if os.name == "posix":          # UNIX系処理
-            # cmdまでkillできるようにするためにexecをつけて実行する
-            self.proc = subprocess.Popen(
-                "exec " + cmd, cwd="cc_scrapy/",
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                shell=True)
-        elif os.name == "nt":           # windows処理
-            self.proc = subprocess.Popen(
-                cmd, cwd="cc_scrapy/",
-                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        else:
-            raise ValueError
-        # 標準出力を一行ずつ取得し、リアルタイム表示するためにループを回す
-        while True:
-            line = self.proc.stdout.readline()
-            if line:
-                try:
-                    line = line.decode('utf-8')
-                except UnicodeDecodeError:
-                    continue
-                yield line
-
-            # 出力がなくなり、サブプロセス処理が完了したらbreak
-            if not line and self.proc.poll() is not None:
-                break
+    def build_arguments(self, category, init_db, job_dir, metrics_path):
+        """
+        scrapyに渡すspiderの引数と上書きする設定を作成
+        output: tuple, (spider引数のdict, 設定のdict)
+        """
+        spider_kwargs = {}
+        settings = {}
+        if category:
+            spider_kwargs["category"] = ",".join(category)
+
+        # DB初期化
+        if init_db:
+            spider_kwargs["init_db"] = 1
+
+        # 早期終了
+        if self.early_terminate:
+            spider_kwargs["end_crawl"] = 1
+
+        # 一時停止・再開用にリクエストキューと取得済みリクエストを保存する
+        if job_dir is not None:
+            settings["JOBDIR"] = str(job_dir.resolve())
+
+        # メトリクスの書き出し先
+        if metrics_path is not None:
+            settings["METRICS_PATH"] = str(metrics_path.resolve())
+
+        # 進捗イベントの送信先
+        settings["PROGRESS_ADDRESS"] = self.progress.address
+        settings["PROGRESS_NAME"] = ",".join(category) if category else "init"
+        return spider_kwargs, settings
+
+    def start_worker(self, category, init_db, job_dir, metrics_path, prefix):
+        """
+        待機中の子プロセスでクロールを開始
+        子プロセスからの出力は読み取り用threadでself.outputに送る
+        """
+        spider_kwargs, settings = self.build_arguments(
+            category, init_db, job_dir, metrics_path)
+        worker = self.worker_pool.acquire()
+        worker.run(spider_kwargs, settings)
+        self.workers.append(worker)
+        self.num_running += 1
+        self.num_started += 1
+        reader = Thread(target=self.read_output,
+                        args=(worker, prefix, settings["PROGRESS_NAME"]),
+                        daemon=True)
+        reader.start()
+        if self.paused() or self.stopped():
+            # 起動前に停止要求があった場合はここで通知する
+            worker.stop()
+
+    def read_output(self, worker, prefix, name):
+        """
+        子プロセスからの出力・終了理由・statsを取得し、self.outputに送る
+        進捗はProgressServerが受信するため、ここではprint出力やエラーのみ扱う
+        """
+        for kind, value in worker.messages():
+            if kind == "log":
+                self.output.put(prefix + value)
+            elif kind == "closed":
+                self.output.put("{0}spider closed: {1}\n".format(
+                    prefix, value))
+            elif kind == "stats":
+                self.stats[name] = value
+                self.output.put(prefix + format_stats(value))
+        self.output.put(None)
+
+    def wait_processes(self):
+        """
+        起動した子プロセスが全て終了するまで出力をリアルタイム表示する
+        強制停止要求があった場合は全子プロセスをkillする
+        """
+        while self.num_running > 0:
+            if self.want_kill:
+                for worker in self.workers:
+                    worker.kill()
+            try:
+                line = self.output.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if line is None:
+                # サブプロセスの出力終了
+                self.num_running -= 1
+                continue
+            print(line, end="")
+        return True
@@ -0,0 +1,78 @@
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import ConnectionFailure, DuplicateKeyError
+from pymongo.database import Database
+from pymongo.collection import Collection
+
+# 起動時にDBへ接続できるか判定するまでの待ち時間[ms]
+STARTUP_TIMEOUT_MS = 3000
+
+# 各コレクションに作成するインデックス (キー, オプション)
+INDEXES = [
+    # 連作の切り替え、レートの登録・インポートで使用
+    ([("comic_key", ASCENDING)], {"unique": True}),
+    # 検索画面(カテゴリ + レート)で使用
+    ([("category", ASCENDING), ("rate", ASCENDING)], {}),
+    # レートのエクスポートで使用
+    ([("rate", ASCENDING)], {}),
+    # 中断したアイテムの削除で使用
+    ([("complete", ASCENDING)], {}),
+]
+
+
+def remove_duplicated_keys(col: Collection) -> int:
+    """
+    comic_keyが重複したドキュメントを、最初に登録されたもの以外削除する
+    一意インデックス作成前の既存データ向け
+    残すドキュメントがunratedで、削除するドキュメントにレートが
+    登録されている場合は、最初に登録されたレートを引き継ぐ
+    """
+    pipeline = [
+        {"$sort": {"_id": ASCENDING}},
+        {"$group": {"_id": "$comic_key", "ids": {"$push": "$_id"},
+                    "rates": {"$push": {"$ifNull": ["$rate", "unrated"]}},
+                    "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    removed = 0
+    for group in col.aggregate(pipeline, allowDiskUse=True):
+        keep_id = group["ids"][0]
+        rates = [rate for rate in group["rates"] if rate != "unrated"]
+        if rates and group["rates"][0] == "unrated":
+            col.update_one({"_id": keep_id}, {"$set": {"rate": rates[0]}})
+        res = col.delete_many({"_id": {"$in": group["ids"][1:]}})
+        removed += res.deleted_count
+    return removed
+
+
+def ensure_indexes(db: Database):
+    """
+    DB内の全コレクションに必要なインデックスを作成する
+    既に作成済みの場合は何もしない
+    """
+    for col_name in db.list_collection_names():
+        col = db[col_name]
+        for keys, options in INDEXES:
+            try:
+                col.create_index(keys, **options)
+            except DuplicateKeyError:
+                # 一意インデックスを作成できない場合は重複を削除して再作成
+                removed = remove_duplicated_keys(col)
+                print("removed {0} duplicated items from {1}".format(
+                    removed, col_name))
+                col.create_index(keys, **options)
+
+
+def ensure_indexes_on_startup():
+    """
+    アプリ起動時にインデックスを作成する
+    DBに接続できない場合は警告のみ表示し、アプリの起動を妨げない
+    """
+    client = MongoClient('localhost', 27017,
+                         serverSelectionTimeoutMS=STARTUP_TIMEOUT_MS)
+    try:
+        ensure_indexes(client['ScrapedData'])
+    except ConnectionFailure as e:
+        print("skipped creating indexes, cannot connect to MongoDB: "
+              "{0}".format(e))
+    finally:
+        client.close()
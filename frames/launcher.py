@@ -0,0 +1,206 @@
+"""
+scrapyのクロールを子プロセスで実行する
+
+子プロセスは起動時にscrapyとプロジェクトを読み込んで待機し、
+クロールの引数を受け取るとCrawlerProcessで実行する。
+twistedのreactorは再起動できないため、1つの子プロセスでクロールは1回だけ行う。
+(このモジュールは子プロセスでも読み込まれるため、wxをimportしない)
+"""
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Any, Dict, List
+
+# scrapyプロジェクト(scrapy.cfg)のディレクトリ
+SCRAPY_PROJECT_DIR = Path(__file__).resolve().parents[1] / "cc_scrapy"
+
+
+class _QueueWriter(object):
+    """
+    子プロセスの標準出力を1行ずつ親プロセスに送る
+    """
+
+    def __init__(self, output) -> None:
+        self.output = output
+        self.lock = Lock()
+        self.buf = ""
+
+    def write(self, text: str) -> None:
+        with self.lock:
+            self.buf += text
+            *lines, self.buf = self.buf.split("\n")
+            for line in lines:
+                self.output.put(("log", line + "\n"))
+
+    def flush(self) -> None:
+        pass
+
+
+class _QueueLogHandler(logging.Handler):
+    """
+    scrapyのエラーログを親プロセスに送る
+    """
+
+    def __init__(self, output) -> None:
+        super().__init__(logging.ERROR)
+        self.output = output
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.output.put(("log", self.format(record) + "\n"))
+
+
+def _wait_stop(control, process) -> None:
+    """
+    親プロセスから停止要求を受けたら、処理中のリクエストを完了させて停止する
+    (scrapyのCtrl-Cと同じ終了処理。JOBDIR指定時は未処理のリクエストが保存される)
+    """
+    from twisted.internet import reactor
+    try:
+        control.recv()
+    except EOFError:
+        return
+    reactor.callFromThread(process.stop)
+
+
+def _worker_main(control, output) -> None:
+    """
+    子プロセスの処理
+    """
+    os.chdir(str(SCRAPY_PROJECT_DIR))
+    sys.path.insert(0, str(SCRAPY_PROJECT_DIR))
+    sys.stdout = _QueueWriter(output)
+    try:
+        # クロールの引数を待つ間に、scrapyとプロジェクトを読み込んでおく
+        from scrapy import signals
+        from scrapy.crawler import CrawlerProcess
+        from scrapy.utils.project import get_project_settings
+        import ComicScrapy.spiders.GetComics  # noqa: F401
+
+        try:
+            command = control.recv()
+        except EOFError:
+            return
+        spider_kwargs, overrides = command
+        settings = get_project_settings()
+        settings.setdict(overrides, priority="cmdline")
+        process = CrawlerProcess(settings)
+        logging.getLogger().addHandler(_QueueLogHandler(output))
+        crawler = process.create_crawler("GetComics")
+
+        def spider_closed(spider, reason):
+            output.put(("closed", reason))
+
+        crawler.signals.connect(spider_closed, signal=signals.spider_closed)
+        Thread(target=_wait_stop, args=(control, process), daemon=True).start()
+        process.crawl(crawler, **spider_kwargs)
+        process.start()
+        output.put(("stats", crawler.stats.get_stats()))
+    except Exception as e:
+        output.put(("log", "crawl failed: {0!r}\n".format(e)))
+    finally:
+        sys.stdout.flush()
+        output.put(("exit", None))
+
+
+class CrawlWorker(object):
+    """
+    クロールを実行する子プロセス
+    """
+
+    def __init__(self) -> None:
+        ctx = mp.get_context("spawn")
+        # 子プロセスからのメッセージ (種別, 内容)
+        #   log: 出力, closed: spiderの終了理由, stats: scrapyのstats,
+        #   exit: 子プロセスの終了
+        self.output = ctx.Queue()
+        self.control, child_control = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child_control, self.output),
+            daemon=True)
+        self.process.start()
+
+    def run(self, spider_kwargs: Dict[str, Any],
+            settings: Dict[str, Any]) -> None:
+        """
+        クロールを開始する
+        spider_kwargs: spiderの引数 (scrapy crawl の -a に相当)
+        settings: 上書きする設定 (scrapy crawl の -s に相当)
+        """
+        self.control.send((spider_kwargs, settings))
+
+    def stop(self) -> None:
+        """
+        処理中のリクエストを完了させて停止する
+        """
+        try:
+            self.control.send(("stop",))
+        except OSError:
+            pass
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def messages(self, timeout: float = 0.5):
+        """
+        子プロセスが終了するまでメッセージを返す
+        """
+        while True:
+            try:
+                kind, value = self.output.get(timeout=timeout)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    # killされた場合はexitが送られない
+                    return
+                continue
+            if kind == "exit":
+                self.process.join()
+                return
+            yield kind, value
+
+
+class WorkerPool(object):
+    """
+    起動済みで待機中の子プロセスを保持し、クロール開始時の待ち時間をなくす
+    """
+
+    def __init__(self, num_idle: int) -> None:
+        """
+        num_idle: 待機させておく子プロセス数
+        """
+        self.num_idle = num_idle
+        self.idle: List[CrawlWorker] = []
+        self.lock = Lock()
+
+    def prewarm(self) -> None:
+        """
+        待機中の子プロセスを補充する
+        """
+        with self.lock:
+            self.idle = [w for w in self.idle if w.is_alive()]
+            while len(self.idle) < self.num_idle:
+                self.idle.append(CrawlWorker())
+
+    def acquire(self) -> CrawlWorker:
+        """
+        待機中の子プロセスを返す (無い場合は新たに起動する)
+        """
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop(0)
+                if worker.is_alive():
+                    return worker
+        return CrawlWorker()
+
+    def close(self) -> None:
+        with self.lock:
+            for worker in self.idle:
+                worker.kill()
+            self.idle = []
@@ -0,0 +1,96 @@
+import logging
+import logging.handlers
+from collections import deque
+from pathlib import Path
+from threading import Lock
+from typing import Deque, List, Optional
+
+import wx
+
+
+class LogView(object):
+    """
+    ログ表示用のTextCtrlにまとめて書き込むための出力先
+    sys.stdoutの置き換えとして使用し、任意のthreadから書き込める
+    書き込まれた文字列は一定間隔で1回のAppendTextにまとめ、
+    表示する行数は上限を超えると古い行から破棄する
+    """
+
+    def __init__(self, parent: wx.Window, text_ctrl: wx.TextCtrl,
+                 max_lines: int, flush_ms: int,
+                 log_path: Optional[Path] = None,
+                 max_bytes: int = 0, backup_count: int = 0) -> None:
+        """
+        max_lines: 表示する行数の上限
+        flush_ms: TextCtrlへの反映間隔[msec]
+        log_path: 全ログの保存先(Noneの場合は保存しない)
+        max_bytes, backup_count: ログファイルのローテーション設定
+        """
+        self.text_ctrl = text_ctrl
+        self.max_lines = max_lines
+        self.lock = Lock()
+        # 未反映の書き込み
+        self.pending: List[str] = []
+        # 表示中の行(上限を超えた古い行は自動的に破棄される)
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        # TextCtrlに表示している行数
+        self.num_shown = 0
+        self.file_logger = None
+        if log_path is not None:
+            log_path.parent.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                str(log_path), maxBytes=max_bytes, backupCount=backup_count,
+                encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.file_logger = logging.getLogger("comist.crawl")
+            self.file_logger.setLevel(logging.INFO)
+            self.file_logger.propagate = False
+            self.file_logger.handlers = [handler]
+        self.timer = wx.Timer(parent)
+        parent.Bind(wx.EVT_TIMER, self._on_timer, self.timer)
+        self.timer.Start(flush_ms)
+
+    def write(self, text: str) -> None:
+        with self.lock:
+            self.pending.append(text)
+
+    def flush(self) -> None:
+        """
+        sys.stdoutとしてのflush
+        任意のthreadから呼ばれるため何もせず、TextCtrlへの反映はタイマーに任せる
+        """
+
+    def _on_timer(self, event=None) -> None:
+        """
+        未反映の書き込みをTextCtrlに反映する(GUI threadでのみ実行)
+        """
+        with self.lock:
+            if not self.pending:
+                return
+            text = "".join(self.pending)
+            self.pending = []
+        new_lines = text.splitlines(keepends=True)
+        self.lines.extend(new_lines)
+        if self.file_logger is not None:
+            for line in new_lines:
+                self.file_logger.info(line.rstrip("\n"))
+        self.num_shown += len(new_lines)
+        if self.num_shown > self.max_lines * 1.2:
+            # 表示行数が上限を一定以上超えたら、保持している行で置き換える
+            # (毎回先頭を削除するより再描画の回数が少ない)
+            self.text_ctrl.SetValue("".join(self.lines))
+            self.text_ctrl.SetInsertionPointEnd()
+            self.num_shown = len(self.lines)
+        else:
+            self.text_ctrl.AppendText(text)
+
+    def close(self) -> None:
+        """
+        未反映の書き込みを反映し、タイマーとログファイルを閉じる
+        """
+        self.timer.Stop()
+        self._on_timer()
+        if self.file_logger is not None:
+            for handler in self.file_logger.handlers:
+                handler.close()
+            self.file_logger.handlers = []
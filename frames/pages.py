@@ -0,0 +1,73 @@
+import io
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import wx
+
+import frames.const as c_
+
+
+def archive_path_of(comic_path: Path) -> Path:
+    """
+    漫画1件分の画像をまとめたアーカイブ(無圧縮zip)のパス
+    (data/Comics/サイト名/カテゴリ/エントリ番号.cbz)
+    """
+    return comic_path.with_name(comic_path.name + ".cbz")
+
+
+class ComicPages(object):
+    """
+    漫画のページ画像を読み込む
+    アーカイブがあればzipのインデックス(central directory)から、
+    無ければ漫画ごとのディレクトリから読み込む
+    """
+
+    def __init__(self, comic_path: Path,
+                 manifest: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        comic_path: 漫画ごとのディレクトリのパス
+        manifest: DBに登録された画像のマニフェスト
+                  (指定時はディレクトリを走査せずにファイル名を取得する)
+        """
+        self.comic_path: Path = comic_path
+        self.archive: Optional[zipfile.ZipFile] = None
+        archive_path = archive_path_of(comic_path)
+        if archive_path.exists():
+            self.archive = zipfile.ZipFile(str(archive_path))
+            names = [info.filename for info in self.archive.infolist()
+                     if not info.is_dir()]
+        elif manifest:
+            names = [page["name"] for page in manifest]
+        elif comic_path.is_dir():
+            names = [path.name for path in comic_path.iterdir()
+                     if path.is_file()]
+        else:
+            names = []
+        # ページ順にソート
+        names.sort(key=c_.natural_keys)
+        self.names: List[str] = names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __enter__(self) -> "ComicPages":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def load(self, idx: int) -> wx.Image:
+        """
+        ページの画像を読み込む
+        アーカイブはページを無圧縮で保持しているため、該当箇所のみ読み込む
+        """
+        name = self.names[idx]
+        if self.archive is None:
+            return wx.Image(str(self.comic_path / name))
+        return wx.Image(io.BytesIO(self.archive.read(name)))
+
+    def close(self) -> None:
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
@@ -0,0 +1,115 @@
+import json
+import socket
+import time
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class ProgressServer(object):
+    """
+    scrapyの進捗イベント(JSON-lines)を受信するソケット
+    scrapyにはaddressを PROGRESS_ADDRESS として渡す
+    受信したイベントはクロールごと(PROGRESS_NAME)の状態に集計する
+    """
+
+    def __init__(self, log: Callable[[str], None]) -> None:
+        """
+        log: 漫画の登録結果をログに出力する関数
+        """
+        self.log = log
+        self.lock = Lock()
+        # クロールの識別名 -> 最新の進捗
+        self.progress: Dict[str, Dict[str, Any]] = {}
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        self.address = "127.0.0.1:{0}".format(self.sock.getsockname()[1])
+        Thread(target=self._accept, daemon=True).start()
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        各クロールの進捗のコピーを返す
+        """
+        with self.lock:
+            return {name: dict(p) for name, p in self.progress.items()}
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                # close()された
+                return
+            Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    def _receive(self, conn: socket.socket) -> None:
+        """
+        1つのscrapyプロセスからイベントを受信する
+        """
+        name = ""
+        with conn, conn.makefile("r", encoding="utf-8") as stream:
+            for line in stream:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event["event"] == "opened":
+                    name = event["job"]
+                    with self.lock:
+                        self.progress[name] = {
+                            "state": "running", "started_at": event["time"]}
+                self._handle(name, event)
+
+    def _handle(self, name: str, event: Dict[str, Any]) -> None:
+        kind = event["event"]
+        if kind == "progress":
+            with self.lock:
+                progress = self.progress.setdefault(
+                    name, {"started_at": event["time"]})
+                progress.update(event)
+        elif kind == "item_stored":
+            self.log("[{0}] stored: {1} ({2} pages)\n".format(
+                name, event["comic_key"], event["num_images"]))
+        elif kind == "item_dropped":
+            self.log("[{0}] dropped: {1}\n".format(name, event["reason"]))
+        elif kind == "closed":
+            with self.lock:
+                self.progress.setdefault(name, {})["state"] = event["reason"]
+
+
+def format_progress(progress: Dict[str, Dict[str, Any]]) -> Tuple[int, str]:
+    """
+    全クロールの進捗を集計し、進捗率[%]と表示用の文字列を返す
+    取得対象のエントリ数は一覧ページのクロールに伴い増加するため、
+    ETAはその時点で判明しているエントリ数に対する見込みとなる
+    """
+    if not progress:
+        return 0, ""
+    entries = stored = dropped = queued = 0
+    num_bytes = 0
+    started_at = min(p.get("started_at", time.time())
+                     for p in progress.values())
+    states: List[str] = []
+    for name, p in sorted(progress.items()):
+        entries += p.get("entries", 0)
+        stored += p.get("items_stored", 0)
+        dropped += p.get("items_dropped", 0)
+        queued += p.get("queue_depth", 0)
+        num_bytes += p.get("html_bytes", 0) + p.get("image_bytes", 0)
+        states.append("{0}: {1}".format(name, p.get("state", "running")))
+    elapsed = max(time.time() - started_at, 1e-6)
+    done = stored + dropped
+    percent = min(100, done * 100 // entries) if entries else 0
+    rate = done / elapsed
+    if rate > 0 and entries > done:
+        eta = "{0:.0f} min".format((entries - done) / rate / 60)
+    else:
+        eta = "-"
+    text = ("{0} / {1} items ({2} stored, {3} dropped)  "
+            "{4:.2f} items/min  {5:.2f} MB/s  queue {6}  ETA {7}\n{8}").format(
+        done, entries, stored, dropped, rate * 60, num_bytes / elapsed / 1e6,
+        queued, eta, "  ".join(states))
+    return percent, text
@@ -1,6 +1,7 @@
 import wx
 from pymongo import MongoClient
 from frames.comic_view import ComicViewFrame
+from frames.pages import ComicPages
 from pathlib import Path
 import frames.const as c_
 from wx import Window, StaticBitmap, StaticText, BoxSizer, Button, Image
@@ -82,6 +83,7 @@ class EntryListPanel(wx.Panel):
     grid_col: int = 4
     n_item_per_page: int = grid_row * grid_col
     image_path: Path = c_.COMIC_PATH
+    rendition_path: Path = c_.RENDITION_PATH
     no_image_path: Path = c_.NO_IMAGE_PATH
     img_w: int = c_.SUMB_WIDTH
     img_h: int = c_.SUMB_HEIGHT
@@ -465,27 +467,29 @@ class EntryListPanel(wx.Panel):
             self.title_obj_list[i].SetLabel(title)
 
             # サムネイル設定処理
-            comic_key = self.s_result[idx *
-                                      self.n_item_per_page + i]["comic_key"]
+            entry = self.s_result[idx * self.n_item_per_page + i]
+            comic_key = entry["comic_key"]
             # target siteの取得
             target_site = self.GetParent().collection_panel.radio_box.GetStringSelection()
+            # 作成済みの表紙サムネイルがあれば使用する
+            cover_path = self.rendition_path / target_site / comic_key / \
+                'cover.jpg'
+            if cover_path.exists():
+                tmp_img = wx.Image(str(cover_path))
+                if tmp_img.GetSize() != (self.img_w, self.img_h):
+                    tmp_img = tmp_img.Scale(
+                        self.img_w, self.img_h, wx.IMAGE_QUALITY_HIGH)
+                self.img_obj_list[i].SetBitmap(tmp_img.ConvertToBitmap())
+                continue
             # 漫画の保存パス作成
             comic_path = self.image_path / target_site / comic_key
 
-            # ファイル数が0ならばスキップ
-            tmp = list(comic_path.glob("*"))
-            if len(tmp) == 0:
-                continue
-            else:
-                # ファイルがあれば拡張子を取得
-                tmp_path = tmp[0]
-                suffix = tmp_path.suffix
-
-            img_pathes = list(comic_path.glob("*" + suffix))
-            # 画像をソートし、先頭ページをサムネイルに使用する
-            img_pathes.sort()
             # 先頭ページをサムネイル用画像に選択
-            tmp_img = wx.Image(str(img_pathes[0]))
+            # (ファイル数が0ならばスキップ)
+            with ComicPages(comic_path, entry.get("manifest")) as pages:
+                if len(pages) == 0:
+                    continue
+                tmp_img = pages.load(0)
             tmp_img = tmp_img.Scale(
                 self.img_w, self.img_h, wx.IMAGE_QUALITY_HIGH)
             thumbnail = tmp_img.ConvertToBitmap()